@@ -0,0 +1,69 @@
+import asyncio
+import weakref
+
+from config import ALBUM_DEBOUNCE
+
+
+# Собирает сообщения одного альбома (media_group_id) в одну пачку. Telegram присылает
+# альбом отдельными сообщениями почти одновременно; пачка отдаётся в flush(context, items),
+# когда в течение delay секунд не пришло ни одного нового сообщения альбома.
+# Обработчик сообщения только кладёт файл в буфер и сразу возвращается, поэтому
+# блокировка состояния пользователя не держится на время ожидания.
+class AlbumCollector:
+    def __init__(self, flush, delay=ALBUM_DEBOUNCE):
+        self.flush = flush
+        self.delay = delay
+        # (user_key, media_group_id) -> {'context': ..., 'items': [...], 'timer': ...}
+        self.pending = {}
+        # Запущенные сохранения: задача -> user_key. Ссылка держит задачу до завершения,
+        # а flush_user по ней дожидается альбомов, которые уже сохраняются
+        self.flushing = {}
+
+    def add(self, user_key, media_group_id, item, context):
+        key = (user_key, media_group_id)
+        album = self.pending.get(key)
+        if album is None:
+            # Контекст (состояние, первое сообщение альбома) берётся от первого сообщения
+            album = self.pending[key] = {'context': context, 'items': [], 'timer': None}
+        else:
+            album['timer'].cancel()
+        album['items'].append(item)
+        album['timer'] = asyncio.get_running_loop().call_later(
+            self.delay, self._start_flush, key
+        )
+
+    def _start_flush(self, key):
+        task = asyncio.ensure_future(self._flush(key))
+        self.flushing[task] = key[0]
+        task.add_done_callback(self.flushing.pop)
+
+    async def _flush(self, key):
+        album = self.pending.pop(key, None)
+        if album is None:
+            return
+        album['timer'].cancel()
+        try:
+            await self.flush(album['context'], album['items'])
+        except Exception as e:
+            print(f"Не удалось сохранить альбом {key[1]}: {e}")
+
+    # Сразу сохраняет все недособранные альбомы пользователя и дожидается уже начатых
+    # сохранений — например, перед отправкой работы
+    async def flush_user(self, user_key):
+        for key in [key for key in self.pending if key[0] == user_key]:
+            await self._flush(key)
+        running = [task for task, key in self.flushing.items() if key == user_key]
+        if running:
+            await asyncio.gather(*running)
+
+
+# Блокировки по пользователю для атомарного дописывания в состояние в пределах процесса.
+# Блокировка живёт, пока её кто-то держит или ждёт, поэтому словарь не растёт.
+_locks = weakref.WeakValueDictionary()
+
+
+def user_lock(user_key):
+    lock = _locks.get(user_key)
+    if lock is None:
+        lock = _locks[user_key] = asyncio.Lock()
+    return lock
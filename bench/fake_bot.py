@@ -0,0 +1,75 @@
+# Подменная сессия Bot API для бенчмарков: запросы в Telegram не уходят,
+# на каждый метод возвращается правдоподобный ответ нужного типа.
+import itertools
+import typing
+from datetime import datetime
+
+from aiogram.client.session.base import BaseSession
+from aiogram.types import Chat, Message
+
+
+class FakeSession(BaseSession):
+    def __init__(self):
+        super().__init__()
+        self.message_ids = itertools.count(1)
+        self.requests = 0
+
+    async def close(self):
+        pass
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+
+    def _message(self, method):
+        chat_id = getattr(method, "chat_id", None) or 1
+        return Message(
+            message_id=next(self.message_ids),
+            date=datetime.now(),
+            chat=Chat(id=chat_id if isinstance(chat_id, int) else 1, type="private"),
+        )
+
+    async def make_request(self, bot, method, timeout=None):
+        self.requests += 1
+        returning = method.__returning__
+        if returning is bool or bool in typing.get_args(returning):
+            return True
+        if returning is Message:
+            return self._message(method)
+        if typing.get_origin(returning) is list:
+            return [self._message(method)]
+        return True
+
+
+_update_ids = itertools.count(1)
+
+
+def _user(user_id):
+    return {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}
+
+
+def _chat_message(user_id, **fields):
+    message = {
+        "message_id": next(_update_ids),
+        "date": 0,
+        "chat": {"id": user_id, "type": "private"},
+        "from": _user(user_id),
+    }
+    message.update(fields)
+    return message
+
+
+def message_update(user_id, **fields):
+    return {"update_id": next(_update_ids), "message": _chat_message(user_id, **fields)}
+
+
+def callback_update(user_id, data):
+    return {
+        "update_id": next(_update_ids),
+        "callback_query": {
+            "id": str(next(_update_ids)),
+            "from": _user(user_id),
+            "chat_instance": "bench",
+            "data": data,
+            "message": _chat_message(user_id, text="bench"),
+        },
+    }
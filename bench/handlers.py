@@ -0,0 +1,162 @@
+# Бенчмарк горячих обработчиков bot.py на локальной базе.
+# Апдейты проходят через настоящий dp, запросы к Bot API уходят в FakeSession.
+#
+#   python bench/handlers.py --scale 100k --db sqlite:///tmp/bench.sqlite3 --iterations 200 --output before.json
+#
+# Результат — JSON с пропускной способностью, p50/p99 и числом запросов к базе на апдейт;
+# файлы двух коммитов удобно сравнивать обычным diff.
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SCALES = {'1k': 1000, '10k': 10000, '100k': 100000, '1m': 1000000}
+
+FSM_USER_ID = 1
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Каждый сценарий готовит апдейт для итерации i; подготовка в замер не входит
+def build_scenarios(bot_module, data, rng):
+    from callbacks import OpenOrder, TakeTask, AdminTasks, SubmitConfirm, ReviewProjects, ReviewProject, TaskFiles, ApproveTask
+    from fake_bot import callback_update, message_update
+
+    bot = bot_module.bot
+    dp = bot_module.dp
+
+    async def submit_work_confirm(i):
+        state = dp.fsm.get_context(bot, chat_id=FSM_USER_ID, user_id=FSM_USER_ID)
+        await state.set_state(bot_module.SubmitWorkForm.upload_files)
+        await state.set_data({
+            'selected_task': rng.choice(data['tasks']),
+            'files': [{'file_id': f"bench-{i}-{n}", 'type': 'photo'} for n in range(10)],
+        })
+        return callback_update(FSM_USER_ID, SubmitConfirm().pack())
+
+    async def take_task(i):
+        return callback_update(rng.choice(data['users']), TakeTask(task_type='script', order_id=data['free_orders'][i]).pack())
+
+    return {
+        'show_projects': lambda i: message_update(rng.choice(data['users']), text="📋 Проекты"),
+        'show_order_info': lambda i: callback_update(rng.choice(data['users']), OpenOrder(order_id=rng.choice(data['orders'])).pack()),
+        'take_task': take_task,
+        'my_tasks': lambda i: message_update(rng.choice(data['users']), text="📝 Мои задачи"),
+        'admin_tasks': lambda i: callback_update(FSM_USER_ID, AdminTasks().pack()),
+        'submit_work_confirm': submit_work_confirm,
+        'admin_completed_tasks_start': lambda i: callback_update(FSM_USER_ID, ReviewProjects().pack()),
+        'display_completed_tasks_for_project': lambda i: callback_update(FSM_USER_ID, ReviewProject(order_id=rng.choice(data['orders'])).pack()),
+        'admin_view_task_files': lambda i: callback_update(FSM_USER_ID, TaskFiles(task_id=rng.choice(data['tasks'])).pack()),
+        'admin_approve_task': lambda i: callback_update(FSM_USER_ID, ApproveTask(task_id=rng.choice(data['tasks'])).pack()),
+    }
+
+
+async def run(args):
+    os.environ['POSTGRES_URI'] = args.db
+    os.environ.setdefault('BOT_TOKEN', '123456:bench-token')
+    os.environ.setdefault('ADMIN_ID', str(FSM_USER_ID))
+    # Кэш искажал бы замеры обращений к базе
+    os.environ.setdefault('CACHE_BACKEND', 'none')
+    # Лимиты Bot API меряли бы паузы, а не обработчики
+    os.environ.setdefault('TELEGRAM_GLOBAL_RATE', '1000000')
+    os.environ.setdefault('TELEGRAM_CHAT_RATE', '1000000')
+    # Сценарии шлют одинаковые апдейты подряд от одного пользователя — ограничитель их бы отбросил
+    os.environ.setdefault('USER_RATE', '1000000')
+    os.environ.setdefault('USER_BURST', '1000000')
+    os.environ.setdefault('DEDUP_WINDOW', '0')
+
+    from prometheus_client import REGISTRY
+
+    import bot as bot_module
+    import database
+    from database.models import Order
+    from fake_bot import FakeSession
+    from metrics import install_query_hook
+    from seed import seed
+
+    await database.setup()
+    install_query_hook()
+    if await Order.exists():
+        raise SystemExit("База не пустая: бенчмарку нужна чистая база, чтобы результаты были сравнимы")
+
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    data = await seed(SCALES[args.scale], args.iterations, rng)
+    seed_seconds = time.perf_counter() - started
+
+    session = FakeSession()
+    bot_module.bot.session = session
+    scenarios = build_scenarios(bot_module, data, rng)
+    selected = args.handlers.split(',') if args.handlers else list(scenarios)
+
+    results = {}
+    for name in selected:
+        make_update = scenarios[name]
+        latencies = []
+        queries = 0
+        api_requests = session.requests
+        for i in range(args.iterations):
+            update = make_update(i)
+            if asyncio.iscoroutine(update):
+                update = await update
+            queries_before = REGISTRY.get_sample_value('bot_db_queries_total') or 0
+            started = time.perf_counter()
+            await bot_module.dp.feed_raw_update(bot_module.bot, update)
+            latencies.append(time.perf_counter() - started)
+            queries += (REGISTRY.get_sample_value('bot_db_queries_total') or 0) - queries_before
+
+        total = sum(latencies)
+        results[name] = {
+            'iterations': args.iterations,
+            'ops_per_second': round(args.iterations / total, 1),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+            'queries_per_update': round(queries / args.iterations, 2),
+            'api_requests_per_update': round((session.requests - api_requests) / args.iterations, 2),
+        }
+        print(f"{name}: {results[name]}", file=sys.stderr)
+
+    await database.close()
+
+    report = {
+        'revision': git_revision(),
+        'scale': args.scale,
+        'db': args.db.split('://')[0],
+        'seed': args.seed,
+        'seed_seconds': round(seed_seconds, 1),
+        'handlers': results,
+    }
+    output = json.dumps(report, indent=2, ensure_ascii=False, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', choices=SCALES, default='1k')
+    parser.add_argument('--db', default='sqlite://:memory:')
+    parser.add_argument('--iterations', type=int, default=100)
+    parser.add_argument('--handlers', default='', help='через запятую; по умолчанию все')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='')
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,168 @@
+# Проигрывание записанной трассы (TRACE_FILE, см. tracing.py) через настоящий dp.
+# Запросы к Bot API уходят в FakeSession, база — локальная.
+#
+#   python bench/replay.py trace.jsonl --speed 10 --db sqlite:///tmp/replay.sqlite3 --output replay.json
+#
+# --speed 1 — в реальном темпе, 10 — в десять раз быстрее, max — без пауз (ограничивает только --concurrency).
+# В трассе остаются id проектов и задач из callback_data; на пустой базе они создаются сидом (--scale),
+# для точного воспроизведения лучше проигрывать на копии рабочей базы.
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+from handlers import SCALES, git_revision, percentile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+# Читает трассу: [(t, update)] с монотонным временем и псевдонимы администраторов.
+# Если в файл дописывали несколько запусков, время следующего продолжает предыдущий.
+def load_trace(path):
+    records = []
+    admins = set()
+    offset = 0.0
+    last = 0.0
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if 'trace' in record:
+                admins.update(record.get('admins', []))
+                offset = last
+                continue
+            last = offset + record['t']
+            records.append((last, record['update']))
+    # update_id должен расти, иначе повторы выглядят как дубли
+    for number, (_, update) in enumerate(records, 1):
+        update['update_id'] = number
+    return records, admins
+
+
+def handler_stats(registry):
+    stats = {}
+    for metric in registry.collect():
+        if metric.name != 'bot_handler_duration_seconds':
+            continue
+        for sample in metric.samples:
+            name = sample.labels.get('handler')
+            if sample.name.endswith('_count'):
+                stats.setdefault(name, {})['count'] = sample.value
+            elif sample.name.endswith('_sum'):
+                stats.setdefault(name, {})['sum'] = sample.value
+    return stats
+
+
+async def run(args):
+    records, admins = load_trace(args.trace)
+    if not records:
+        raise SystemExit("Трасса пустая")
+
+    os.environ['POSTGRES_URI'] = args.db
+    os.environ['TRACE_FILE'] = ''
+    os.environ['METRICS_PORT'] = '0'
+    os.environ.setdefault('BOT_TOKEN', '123456:replay-token')
+    # Администраторы в трассе под псевдонимами — они же становятся администраторами бота
+    os.environ['ADMIN_ID'] = ','.join(str(admin) for admin in sorted(admins)) or '1'
+    # Меряем бота, а не лимиты Telegram; лимит на пользователя остаётся как в бою
+    os.environ.setdefault('TELEGRAM_GLOBAL_RATE', '1000000')
+    os.environ.setdefault('TELEGRAM_CHAT_RATE', '1000000')
+
+    from prometheus_client import REGISTRY
+
+    import bot as bot_module
+    import database
+    from database.models import Order
+    from fake_bot import FakeSession
+    from seed import seed
+
+    await database.setup()
+    if not await Order.exists():
+        import random
+        await seed(SCALES[args.scale], 0, random.Random(args.seed))
+
+    session = FakeSession()
+    bot_module.bot.session = session
+    dp = bot_module.dp
+    # Как в бою: фоновые воркеры уведомлений и счётчик запросов к базе
+    await dp.emit_startup(bot=bot_module.bot)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+    lags = []
+    errors = 0
+
+    async def feed(scheduled, update):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            lags.append(max(0.0, started - scheduled))
+            try:
+                await dp.feed_raw_update(bot_module.bot, update)
+            except Exception as e:
+                errors += 1
+                if errors <= 10:
+                    print(f"Ошибка апдейта {update['update_id']}: {e!r}", file=sys.stderr)
+            # Задержка считается от момента, когда апдейт должен был прийти: очередь тоже входит
+            latencies.append(time.perf_counter() - scheduled)
+
+    queries_before = REGISTRY.get_sample_value('bot_db_queries_total') or 0
+    started = time.perf_counter()
+    tasks = []
+    for t, update in records:
+        if args.speed == 'max':
+            scheduled = time.perf_counter()
+        else:
+            scheduled = started + t / float(args.speed)
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(feed(scheduled, update)))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+    queries = (REGISTRY.get_sample_value('bot_db_queries_total') or 0) - queries_before
+
+    await dp.emit_shutdown(bot=bot_module.bot)
+    await database.close()
+
+    report = {
+        'revision': git_revision(),
+        'trace': os.path.basename(args.trace),
+        'speed': args.speed,
+        'db': args.db.split('://')[0],
+        'updates': len(records),
+        'trace_seconds': round(records[-1][0], 1),
+        'elapsed_seconds': round(elapsed, 2),
+        'updates_per_second': round(len(records) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'max_lag_ms': round(max(lags) * 1000, 3),
+        'errors': errors,
+        'queries_per_update': round(queries / len(records), 2),
+        'api_requests_per_update': round(session.requests / len(records), 2),
+        'handlers': {
+            name: {'calls': int(s['count']), 'mean_ms': round(s['sum'] / s['count'] * 1000, 3)}
+            for name, s in handler_stats(REGISTRY).items() if s.get('count')
+        },
+    }
+    output = json.dumps(report, indent=2, ensure_ascii=False, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('trace')
+    parser.add_argument('--speed', default='1', help='множитель темпа (1, 10, ...) или max')
+    parser.add_argument('--db', default='sqlite://:memory:')
+    parser.add_argument('--scale', choices=SCALES, default='1k', help='размер сида для пустой базы')
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='')
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,113 @@
+# Микробенчмарк маршрутизации нажатий: сколько стоит довести апдейт до обработчика,
+# когда обработчиков много. Сравниваются цепочка фильтров aiogram (lambda c: c.data.startswith(...),
+# как было в bot.py) и таблица маршрутов CallbackRouter из callbacks.py.
+# Обработчики пустые, база и Bot API не участвуют — меряется только диспетчеризация.
+#
+#   python bench/routing.py --routes 10,50,200 --iterations 2000 --output routing.json
+#
+# Нажимается кнопка последнего зарегистрированного обработчика — худший случай для цепочки фильтров.
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+from handlers import git_revision, percentile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+async def noop(callback_query):
+    return None
+
+
+def linear_dispatcher(count):
+    from aiogram import Dispatcher
+
+    dp = Dispatcher()
+    for i in range(count):
+        prefix = f"action{i}_"
+        dp.callback_query.register(noop, lambda c, prefix=prefix: c.data.startswith(prefix))
+    return dp, f"action{count - 1}_42"
+
+
+def indexed_dispatcher(count):
+    from aiogram import Dispatcher
+    from aiogram.filters.callback_data import CallbackData
+
+    from callbacks import CallbackRouter
+
+    dp = Dispatcher()
+    router = CallbackRouter()
+    factory = None
+    for i in range(count):
+        factory = type(f"Action{i}", (CallbackData,), {'__annotations__': {'item_id': int}}, prefix=f"action{i}")
+        router.route(factory)(noop)
+    router.setup(dp)
+    return dp, factory(item_id=42).pack()
+
+
+async def measure(dp, bot, data, iterations):
+    from aiogram.types import Update
+
+    update = Update.model_validate({
+        'update_id': 1,
+        'callback_query': {
+            'id': '1', 'chat_instance': 'bench', 'data': data,
+            'from': {'id': 1, 'is_bot': False, 'first_name': 'bench'},
+        },
+    }, context={'bot': bot})
+    # Прогрев: ленивые структуры aiogram и кэши pydantic
+    for _ in range(100):
+        await dp.feed_update(bot, update)
+
+    latencies = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        await dp.feed_update(bot, update)
+        latencies.append(time.perf_counter() - started)
+    return {
+        'p50_us': round(percentile(latencies, 50) * 1e6, 2),
+        'p99_us': round(percentile(latencies, 99) * 1e6, 2),
+        'mean_us': round(sum(latencies) / len(latencies) * 1e6, 2),
+    }
+
+
+async def run(args):
+    os.environ.setdefault('BOT_TOKEN', '123456:bench-token')
+    os.environ.setdefault('ADMIN_ID', '1')
+    os.environ['METRICS_PORT'] = '0'
+
+    from aiogram import Bot
+
+    bot = Bot(token=os.environ['BOT_TOKEN'])
+    results = {}
+    for count in [int(n) for n in args.routes.split(',')]:
+        results[count] = {}
+        for name, build in (('linear', linear_dispatcher), ('indexed', indexed_dispatcher)):
+            dp, data = build(count)
+            results[count][name] = await measure(dp, bot, data, args.iterations)
+        print(f"{count}: {results[count]}", file=sys.stderr)
+    await bot.session.close()
+
+    report = {
+        'revision': git_revision(),
+        'iterations': args.iterations,
+        'routes': results,
+    }
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--routes', default='10,50,200', help='числа обработчиков через запятую')
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--output', default='')
+    asyncio.run(run(parser.parse_args()))
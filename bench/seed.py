@@ -0,0 +1,81 @@
+# Наполнение локальной базы синтетическими данными для бенчмарков.
+# scale — число задач; проектов в 5 раз меньше (по задаче каждого типа), у каждой задачи одна версия сдачи с одним файлом.
+from tortoise import timezone
+
+from database.models import Order, Task, Submission, SubmittedFile
+from database.progress import rebuild_progress
+from database.registry import TASK_TYPES, TaskStatus
+
+STATUSES = list(TaskStatus)
+FILE_TYPES = ['photo', 'video', 'document']
+FIRST_USER_ID = 100000
+BATCH_SIZE = 5000
+
+
+def user_count(scale):
+    return max(10, scale // 100)
+
+
+async def _insert(model, objects):
+    for start in range(0, len(objects), BATCH_SIZE):
+        await model.bulk_create(objects[start:start + BATCH_SIZE])
+
+
+# Все id таблицы пачками по ключу, без загрузки строк целиком
+async def _ids(model):
+    ids = []
+    last = 0
+    while True:
+        batch = await model.filter(id__gt=last).order_by('id').limit(BATCH_SIZE).values_list('id', flat=True)
+        if not batch:
+            return ids
+        ids.extend(batch)
+        last = batch[-1]
+
+
+async def seed(scale, free_orders, rng):
+    users = user_count(scale)
+    order_count = -(-scale // len(TASK_TYPES))
+
+    await _insert(Order, [
+        Order(title=f"Проект {i}", description=f"Описание проекта {i}") for i in range(order_count + free_orders)
+    ])
+    order_ids = await _ids(Order)
+
+    tasks = []
+    for order_id in order_ids[:order_count]:
+        for task_type in TASK_TYPES:
+            if len(tasks) == scale:
+                break
+            tasks.append(Task(
+                order_id=order_id,
+                task_type=task_type.code,
+                user_id=str(FIRST_USER_ID + rng.randrange(users)),
+                status=rng.choice(STATUSES),
+            ))
+    await _insert(Task, tasks)
+    del tasks
+
+    task_ids = await _ids(Task)
+    now = timezone.now()
+    for start in range(0, len(task_ids), BATCH_SIZE):
+        batch = task_ids[start:start + BATCH_SIZE]
+        # Версия 1 со статусом задачи — как у баз, переведённых миграцией
+        statuses = await Task.filter(id__in=batch).values_list('id', 'status')
+        await Submission.bulk_create([
+            Submission(task_id=task_id, version=1, status=status, files=1, updated_at=now)
+            for task_id, status in statuses
+        ])
+        await SubmittedFile.bulk_create([
+            SubmittedFile(task_id=task_id, file_id=f"seed-file-{task_id}", file_type=rng.choice(FILE_TYPES))
+            for task_id in batch
+        ])
+    # Данные вставлены в обход обработчиков — сводку прогресса собираем целиком
+    await rebuild_progress(batch_size=BATCH_SIZE)
+
+    return {
+        'orders': order_ids[:order_count],
+        'free_orders': order_ids[order_count:],
+        'tasks': task_ids,
+        'users': [FIRST_USER_ID + i for i in range(users)],
+    }
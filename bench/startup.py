@@ -0,0 +1,97 @@
+# Бенчмарк холодного старта: каждый замер — отдельный свежий процесс.
+#
+#   python bench/startup.py --runs 5 --output startup.json
+#
+# Меряются импорт bot (вместе с aiogram и конфигом), инициализация базы на новой
+# и на уже размеченной базе и первый апдейт через dp с FakeSession.
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from handlers import git_revision, percentile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH = os.path.dirname(os.path.abspath(__file__))
+
+# Код, который исполняется в дочернем процессе; печатает JSON с фазами в секундах
+CHILD = r'''
+import time
+started = time.perf_counter()
+import asyncio, json, sys
+sys.path[:0] = [ROOT, BENCH]
+import bot as bot_module
+imported = time.perf_counter()
+
+async def main():
+    import database
+    from fake_bot import FakeSession, message_update
+    before_setup = time.perf_counter()
+    await database.setup()
+    ready = time.perf_counter()
+    bot_module.bot.session = FakeSession()
+    await bot_module.dp.feed_raw_update(bot_module.bot, message_update(1, text="/start"))
+    first_update = time.perf_counter()
+    await database.close()
+    print(json.dumps({
+        'import': imported - started,
+        'setup': ready - before_setup,
+        'first_update': first_update - ready,
+        'total': first_update - started,
+    }))
+
+asyncio.run(main())
+'''
+
+
+def run_child(db):
+    env = dict(os.environ, POSTGRES_URI=db, CACHE_BACKEND='none', METRICS_PORT='0')
+    env.setdefault('BOT_TOKEN', '123456:bench-token')
+    env.setdefault('ADMIN_ID', '1')
+    code = f"ROOT = {ROOT!r}\nBENCH = {BENCH!r}\n" + CHILD
+    out = subprocess.check_output([sys.executable, '-c', code], env=env, cwd=ROOT, text=True)
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def summarize(samples):
+    return {
+        phase: {
+            'p50_ms': round(percentile([s[phase] for s in samples], 50) * 1000, 1),
+            'max_ms': round(max(s[phase] for s in samples) * 1000, 1),
+        }
+        for phase in samples[0]
+    }
+
+
+def main(args):
+    fresh = []
+    migrated = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for i in range(args.runs):
+            # Первый запуск на новой базе создаёт схему, второй — обычный рестарт
+            db = f"sqlite://{os.path.join(tmp, f'startup-{i}.sqlite3')}"
+            fresh.append(run_child(db))
+            migrated.append(run_child(db))
+            print(f"run {i + 1}: fresh {fresh[-1]['total']:.2f} s, restart {migrated[-1]['total']:.2f} s", file=sys.stderr)
+
+    report = {
+        'revision': git_revision(),
+        'runs': args.runs,
+        'fresh_db': summarize(fresh),
+        'restart': summarize(migrated),
+    }
+    output = json.dumps(report, indent=2, ensure_ascii=False, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--output', default='')
+    main(parser.parse_args())
@@ -0,0 +1,106 @@
+# Проверка обезличивания трассы (tracing.anonymize) на апдейтах с персональными данными:
+# документ с именем файла, пересланные сообщения, контакт, участники чата.
+#
+#   python bench/trace_privacy.py
+#
+# Апдейт проходит тот же путь, что в TraceRecorder: модель aiogram -> JSON -> anonymize.
+# В записи не должно остаться ни исходных id, ни имён, ни имени файла, а сама запись должна
+# оставаться валидным апдейтом для bench/replay.py. При нарушении скрипт завершается с ошибкой.
+import json
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+os.environ.setdefault('BOT_TOKEN', '123456:bench-token')
+os.environ.setdefault('ADMIN_ID', '1')
+
+WORKER_ID = 700100200
+FORWARDED_ID = 700300400
+CONTACT_ID = 700500600
+CHANNEL_ID = -1001234567890
+SECRETS = ["Ivanov_passport_scan.pdf", "Иванов", "Иван", "ivanov", "+79001234567", "Пётр Петров", "Секретный канал"]
+
+
+def user(user_id, first_name="Иван"):
+    return {"id": user_id, "is_bot": False, "first_name": first_name, "last_name": "Иванов", "username": "ivanov"}
+
+
+def message(extra, message_id=1):
+    payload = {
+        "message_id": message_id,
+        "date": 0,
+        "chat": {"id": WORKER_ID, "type": "private", "first_name": "Иван", "username": "ivanov"},
+        "from": user(WORKER_ID),
+    }
+    payload.update(extra)
+    return payload
+
+
+# Апдейты разной формы; id каждого — свой, чтобы ошибка указывала на случай
+PAYLOADS = {
+    'document': message({"document": {"file_id": "DOC1", "file_unique_id": "U1", "file_name": "Ivanov_passport_scan.pdf"}}),
+    'forward_user': message({
+        "forward_origin": {"type": "user", "date": 0, "sender_user": user(FORWARDED_ID, "Пётр Петров")},
+        "text": "пересланное",
+    }),
+    'forward_hidden_user': message({
+        "forward_origin": {"type": "hidden_user", "date": 0, "sender_user_name": "Пётр Петров"},
+        "text": "пересланное",
+    }),
+    'forward_channel': message({
+        "forward_origin": {"type": "channel", "date": 0, "message_id": 5, "author_signature": "Пётр Петров",
+                           "chat": {"id": CHANNEL_ID, "type": "channel", "title": "Секретный канал"}},
+        "text": "пересланное",
+    }),
+    # Старый формат пересылки (до Bot API 7.0) попадает в трассу как дополнительные поля
+    'forward_legacy': message({
+        "forward_from": user(FORWARDED_ID, "Пётр Петров"),
+        "forward_from_chat": {"id": CHANNEL_ID, "type": "channel", "title": "Секретный канал"},
+        "forward_sender_name": "Пётр Петров",
+        "text": "пересланное",
+    }),
+    'contact': message({"contact": {"phone_number": "+79001234567", "first_name": "Пётр Петров",
+                                    "last_name": "Иванов", "user_id": CONTACT_ID,
+                                    "vcard": "BEGIN:VCARD\nFN:Пётр Петров\nEND:VCARD"}}),
+    'new_members': message({"new_chat_members": [user(FORWARDED_ID, "Пётр Петров"), user(CONTACT_ID)]}),
+}
+
+
+def check(name, record, raw_ids):
+    from aiogram.types import Update
+
+    errors = []
+    dumped = json.dumps(record, ensure_ascii=False)
+    for secret in SECRETS:
+        if secret in dumped:
+            errors.append(f"{name}: в трассе осталось {secret!r}")
+    for raw_id in raw_ids:
+        if str(raw_id) in dumped:
+            errors.append(f"{name}: в трассе остался id {raw_id}")
+    try:
+        Update.model_validate(record)
+    except Exception as e:
+        errors.append(f"{name}: запись трассы не разбирается как апдейт: {e}")
+    return errors
+
+
+def main():
+    from aiogram.types import Update
+
+    from tracing import anonymize
+
+    errors = []
+    for index, (name, payload) in enumerate(PAYLOADS.items(), 1):
+        event = Update.model_validate({"update_id": index, "message": payload})
+        record = anonymize(event.model_dump(mode='json', exclude_none=True, by_alias=True))
+        errors += check(name, record, [WORKER_ID, FORWARDED_ID, CONTACT_ID, abs(CHANNEL_ID)])
+
+    print(json.dumps({'cases': len(PAYLOADS), 'errors': errors}, indent=2, ensure_ascii=False))
+    if errors:
+        raise SystemExit(f"Нарушений: {len(errors)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# Нагрузочный прогон webhook: отправляет записанные апдейты (JSON Lines, по апдейту в строке)
+# на локальный сервер и печатает пропускную способность и задержки ответа.
+#
+#   python bench/webhook_load.py updates.jsonl --url http://127.0.0.1:8080/webhook --secret ... --concurrency 100 --repeat 10
+import argparse
+import asyncio
+import json
+import time
+
+from aiohttp import ClientSession
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def load_updates(path, repeat):
+    with open(path, encoding="utf-8") as f:
+        updates = [json.loads(line) for line in f if line.strip()]
+    # update_id должен расти, иначе повторы выглядят как дубли
+    result = []
+    for round_number in range(repeat):
+        for update in updates:
+            update = dict(update)
+            update["update_id"] = len(result) + 1
+            result.append(update)
+    return result
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+async def run(args):
+    updates = load_updates(args.path, args.repeat)
+    queue = asyncio.Queue()
+    for update in updates:
+        queue.put_nowait(update)
+
+    latencies = []
+    errors = 0
+    headers = {SECRET_HEADER: args.secret} if args.secret else {}
+
+    async def client(session):
+        nonlocal errors
+        while not queue.empty():
+            update = queue.get_nowait()
+            started = time.perf_counter()
+            async with session.post(args.url, json=update, headers=headers) as response:
+                await response.read()
+                if response.status != 200:
+                    errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    async with ClientSession() as session:
+        await asyncio.gather(*(client(session) for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    print(json.dumps({
+        "updates": len(updates),
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "updates_per_second": round(len(updates) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path")
+    parser.add_argument("--url", default="http://127.0.0.1:8080/webhook")
+    parser.add_argument("--secret", default="")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=1)
+    asyncio.run(run(parser.parse_args()))
@@ -1,18 +1,62 @@
 from aiogram import Bot, Dispatcher, F
-from aiogram.types import Message, InlineKeyboardButton, InlineKeyboardMarkup, CallbackQuery, KeyboardButton, ReplyKeyboardMarkup, FSInputFile, BufferedInputFile, InputMediaDocument, InputMediaPhoto, InputMediaVideo
+from aiogram.types import Message, InlineKeyboardButton, InlineKeyboardMarkup, CallbackQuery, KeyboardButton, ReplyKeyboardMarkup
 from aiogram.filters import Command, CommandStart
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.fsm.storage.memory import MemoryStorage
-from config import BOT_TOKEN, ADMIN_ID
-from database.models import Order, Task, SubmittedFile
-from database import setup
+from config import BOT_TOKEN, ADMIN_ID, BOT_MODE, PROJECTS_PAGE_SIZE, TELEGRAM_GLOBAL_RATE, TELEGRAM_CHAT_RATE
+from database.models import Order, Task
+from database import setup, close
+from database.queries import (
+    get_orders_page, iter_task_rows, get_review_queue, claim_task, save_submitted_files,
+    review_submissions, get_submission, get_submissions, get_version_files,
+)
+from database.progress import refresh_progress, rebuild_progress, get_projects_with_files, get_progress
+from database.registry import TaskStatus, STATUS_LABELS, TASK_TYPES, TASK_TYPES_BY_KEY, task_type_label
+from cache import cache, get_order, get_cached_task_board, get_first_projects_page, invalidate_projects, invalidate_task_board
+from delivery import Delivery
+from storage import create_storage, create_events_isolation
+from outbox import Outbox, enqueue_notification, enqueue_notifications
+from metrics import MetricsServer, setup_metrics
+from throttling import setup_throttling
+from tracing import setup_tracing
+from albums import AlbumCollector, user_lock
+from export import export_to_tempfile
+from callbacks import (
+    CallbackRouter, to_micros, from_micros, ProjectsPage, OpenOrder, BackToProjects, NewOrder, TakeTask,
+    AdminTasks, AdminPanel, AdminExport, SubmitProject, SubmitTask, SubmitConfirm, SubmitBack,
+    ReviewProjects, ReviewProject, TaskFiles, TaskHistory, TaskVersion, ApproveTask, RejectTask, RejectSkip, RejectBack,
+    BulkOpen, BulkToggle, BulkSelect, BulkApply,
+)
 from collections import defaultdict
-from tortoise import fields, models
 from datetime import datetime
+import html
+import os
+import time
+from tortoise.transactions import in_transaction
 
 bot = Bot(token=BOT_TOKEN)
-dp = Dispatcher(storage=MemoryStorage())
+# Хранилище FSM выбирается в конфиге (FSM_STORAGE), по умолчанию — в памяти процесса
+storage = create_storage()
+dp = Dispatcher(storage=storage, events_isolation=create_events_isolation(storage))
+delivery = Delivery(bot, global_rate=TELEGRAM_GLOBAL_RATE, chat_rate=TELEGRAM_CHAT_RATE)
+# Уведомления исполнителям отправляются фоном из таблицы notifications
+outbox = Outbox(delivery)
+dp.startup.register(outbox.start)
+dp.shutdown.register(outbox.stop)
+# Задержки обработчиков, запросы к базе и к Bot API отдаются на /metrics
+setup_metrics(dp, bot)
+# Обезличенная трасса апдейтов (TRACE_FILE) — до ограничителя, чтобы в неё попадал весь поток.
+# Тексты кнопок меню сохраняются: по ним маршрутизируются сообщения
+setup_tracing(dp, keep_texts={"📋 Проекты", "📝 Мои задачи", "📤 Сдать работу"})
+# Лимит апдейтов на пользователя и склейка повторных нажатий одной кнопки.
+# Переключатели массовой проверки нажимают повторно намеренно — их не склеиваем
+setup_throttling(dp, repeatable={BulkToggle.__prefix__, BulkSelect.__prefix__})
+metrics_server = MetricsServer()
+dp.startup.register(metrics_server.start)
+dp.shutdown.register(metrics_server.stop)
+# Все нажатия кнопок идут через одну таблицу маршрутов (callbacks.py)
+callbacks = CallbackRouter()
+callbacks.setup(dp)
 
 class OrderForm(StatesGroup):
     title = State()
@@ -32,26 +76,43 @@ class SubmitWorkForm(StatesGroup):
 class AdminRejectTaskForm(StatesGroup):
     reason = State()
 
-TASK_TYPE_MAP = {
-    'script': 'Написание сценария',
-    'voice': 'Озвучка',
-    'edit': 'Монтаж',
-    'preview': 'Создание превью',
-    'upload': 'Отгрузка видео',
-}
+# Массовая проверка: администратор отмечает задачи и одобряет/отклоняет их разом
+class AdminBulkReviewForm(StatesGroup):
+    select = State()
+
+# Лимиты Telegram на длину текста одного сообщения и подписи к файлам
+MESSAGE_LIMIT = 4096
+CAPTION_LIMIT = 1024
+
+# Сколько задач показывается на экране массовой проверки
+BULK_REVIEW_LIMIT = 50
+
+# Статические клавиатуры собираются один раз при импорте, а не на каждое сообщение
+START_KEYBOARD = ReplyKeyboardMarkup(
+    keyboard=[
+        [KeyboardButton(text="📋 Проекты")],
+        [KeyboardButton(text="📝 Мои задачи"), KeyboardButton(text="📤 Сдать работу")]
+    ],
+    resize_keyboard=True
+)
+
+ADMIN_KEYBOARD = InlineKeyboardMarkup(
+    inline_keyboard=[
+        [InlineKeyboardButton(text="Новый заказ", callback_data=NewOrder().pack())],
+        [InlineKeyboardButton(text="Список задач пользователей", callback_data=AdminTasks().pack())],
+        [InlineKeyboardButton(text="Выполненные задачи", callback_data=ReviewProjects().pack())],
+        [InlineKeyboardButton(text="📦 Выгрузка в CSV", callback_data=AdminExport().pack())]
+    ]
+)
+
+# Лимит Bot API на размер загружаемого ботом документа
+DOCUMENT_SIZE_LIMIT = 50 * 1024 * 1024
 
 @dp.message(CommandStart())
 async def cmd_start(message: Message):
-    keyboard = ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="📋 Проекты")],
-            [KeyboardButton(text="📝 Мои задачи"), KeyboardButton(text="📤 Сдать работу")]
-        ],
-        resize_keyboard=True
-    )
     await message.reply(
         "Добро пожаловать в TeamReelBot!\n\nЯ помогу вам управлять проектами и заказами.\n\nДля администраторов доступна команда /admin",
-        reply_markup=keyboard
+        reply_markup=START_KEYBOARD
     )
 
 @dp.message(Command("admin"))
@@ -60,85 +121,158 @@ async def cmd_admin(message: Message):
         await message.reply("У вас нет прав администратора")
         return
     
-    keyboard = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [InlineKeyboardButton(text="Новый заказ", callback_data="new_order")],
-            [InlineKeyboardButton(text="Список задач пользователей", callback_data="admin_tasks")],
-            [InlineKeyboardButton(text="Выполненные задачи", callback_data="admin_completed_tasks_start")]
-        ]
+    await message.reply("Админ панель", reply_markup=ADMIN_KEYBOARD)
+
+# Курсор страницы в callback_data: время создания и id крайнего проекта
+def projects_cursor_data(direction, row):
+    return ProjectsPage(direction=direction, created_at=to_micros(row['created_at']), order_id=row['id']).pack()
+
+async def build_projects_page(cursor=None, backward=False):
+    if cursor is None:
+        rows, has_more = await get_first_projects_page()
+    else:
+        rows, has_more = await get_orders_page(PROJECTS_PAGE_SIZE, cursor, backward)
+    if not rows:
+        return None
+
+    if backward:
+        has_prev, has_next = has_more, True
+    else:
+        has_prev, has_next = cursor is not None, has_more
+
+    buttons = [
+        [InlineKeyboardButton(text=row['title'], callback_data=OpenOrder(order_id=row['id']).pack())]
+        for row in rows
+    ]
+    navigation = []
+    if has_prev:
+        navigation.append(InlineKeyboardButton(text="⬅️", callback_data=projects_cursor_data("prev", rows[0])))
+    if has_next:
+        navigation.append(InlineKeyboardButton(text="➡️", callback_data=projects_cursor_data("next", rows[-1])))
+    if navigation:
+        buttons.append(navigation)
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+@dp.message(Command("cache_stats"))
+async def cmd_cache_stats(message: Message):
+    if str(message.from_user.id) not in ADMIN_ID:
+        await message.reply("У вас нет прав администратора")
+        return
+
+    stats = cache.stats()
+    lookups = stats['hits'] + stats['misses']
+    hit_rate = stats['hits'] / lookups * 100 if lookups else 0
+    await message.reply(
+        f"Кэш ({stats['backend']}):\n"
+        f"Попаданий: {stats['hits']}\n"
+        f"Промахов: {stats['misses']}\n"
+        f"Доля попаданий: {hit_rate:.1f}%"
     )
-    await message.reply("Админ панель", reply_markup=keyboard)
+
+@dp.message(Command("rebuild_progress"))
+async def cmd_rebuild_progress(message: Message):
+    if str(message.from_user.id) not in ADMIN_ID:
+        await message.reply("У вас нет прав администратора")
+        return
+
+    count = await rebuild_progress()
+    await message.reply(f"Сводка прогресса пересобрана для {count} проектов.")
+
+# Выгрузка проектов, задач и файлов одним сжатым CSV; строки пишутся потоково
+async def send_export(chat_id):
+    path, count = await export_to_tempfile()
+    try:
+        if os.path.getsize(path) > DOCUMENT_SIZE_LIMIT:
+            await delivery.send_message(chat_id, "Выгрузка больше 50 МБ — Telegram не примет такой файл.")
+            return
+        filename = f"teamreel-{datetime.now().strftime('%Y%m%d-%H%M')}.csv.gz"
+        await delivery.send_document(chat_id, path, filename=filename, caption=f"Строк в выгрузке: {count}")
+    finally:
+        os.remove(path)
+
+@dp.message(Command("export"))
+async def cmd_export(message: Message):
+    if str(message.from_user.id) not in ADMIN_ID:
+        await message.reply("У вас нет прав администратора")
+        return
+
+    await message.reply("Готовлю выгрузку...")
+    await send_export(message.chat.id)
+
+@callbacks.route(AdminExport)
+async def admin_export(callback_query: CallbackQuery):
+    if str(callback_query.from_user.id) not in ADMIN_ID:
+        await callback_query.answer("У вас нет прав администратора", show_alert=True)
+        return
+
+    await callback_query.answer("Готовлю выгрузку...")
+    await send_export(callback_query.message.chat.id)
 
 @dp.message(lambda message: message.text == "📋 Проекты")
 async def show_projects(message: Message):
-    orders = await Order.all()
-    if not orders:
+    keyboard = await build_projects_page()
+    if not keyboard:
         await message.reply("Список проектов пуст")
         return
     
-    keyboard = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [InlineKeyboardButton(text=order.title, callback_data=f"order_{order.id}")] 
-            for order in orders
-        ]
-    )
-    
     await message.reply("Список проектов:", reply_markup=keyboard)
 
-@dp.callback_query(lambda c: c.data.startswith("order_"))
-async def show_order_info(callback_query: CallbackQuery):
-    order_id = int(callback_query.data.split("_")[1])
-    order = await Order.get(id=order_id)
-    
-    # Кнопки задач
-    task_types = [
-        ('script', 'Написание сценария'),
-        ('voice', 'Озвучка'),
-        ('edit', 'Монтаж'),
-        ('preview', 'Создание превью'),
-        ('upload', 'Отгрузка видео')
-    ]
+@callbacks.route(ProjectsPage)
+async def show_projects_page(callback_query: CallbackQuery, callback_data: ProjectsPage):
+    cursor = (from_micros(callback_data.created_at), callback_data.order_id)
+    keyboard = await build_projects_page(cursor, backward=callback_data.direction == "prev")
+    if not keyboard:
+        # Соседняя страница опустела (проекты удалены) — начинаем сначала
+        keyboard = await build_projects_page()
+    if not keyboard:
+        await callback_query.message.edit_text("Список проектов пуст")
+        return
+
+    await callback_query.message.edit_text("Список проектов:", reply_markup=keyboard)
+    await callback_query.answer()
+
+@callbacks.route(OpenOrder)
+async def show_order_info(callback_query: CallbackQuery, callback_data: OpenOrder):
+    order_id = callback_data.order_id
+    order = await get_order(order_id)
+    if not order:
+        await callback_query.answer("Проект не найден", show_alert=True)
+        return
     
+    # Кнопки задач: занятость всех типов одним запросом (или из кэша)
+    board = await get_cached_task_board(order_id)
+
     task_buttons = []
-    for key, text in task_types:
-        # Проверяем, есть ли задача этого типа для данного заказа
-        existing_task = await Task.filter(order_id=order_id, task_type=text).first()
-        button_text = text
-        if existing_task:
+    for task_type in TASK_TYPES:
+        button_text = task_type.label
+        if task_type.code in board:
             button_text += " (Занято)"
-        task_buttons.append(InlineKeyboardButton(text=button_text, callback_data=f"task_{key}_{order_id}"))
+        task_buttons.append(InlineKeyboardButton(text=button_text, callback_data=TakeTask(task_type=task_type.key, order_id=order_id).pack()))
 
     keyboard = InlineKeyboardMarkup(
         inline_keyboard=[
             [btn] for btn in task_buttons
-        ] + [[InlineKeyboardButton(text="Назад", callback_data="back_to_projects")]]
+        ] + [[InlineKeyboardButton(text="Назад", callback_data=BackToProjects().pack())]]
     )
     
     await callback_query.message.edit_text(
         f"Информация о проекте:\n\n"
-        f"Название: {order.title}\n"
-        f"Описание: {order.description}\n"
-        f"Создан: {order.created_at.strftime('%d.%m.%Y')}",
+        f"Название: {order['title']}\n"
+        f"Описание: {order['description']}\n"
+        f"Создан: {order['created_at'].strftime('%d.%m.%Y')}",
         reply_markup=keyboard
     )
 
-@dp.callback_query(lambda c: c.data == "back_to_projects")
+@callbacks.route(BackToProjects)
 async def back_to_projects(callback_query: CallbackQuery):
-    orders = await Order.all()
-    if not orders:
+    keyboard = await build_projects_page()
+    if not keyboard:
         await callback_query.message.edit_text("Список проектов пуст")
         return
     
-    keyboard = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [InlineKeyboardButton(text=order.title, callback_data=f"order_{order.id}")] 
-            for order in orders
-        ]
-    )
-    
     await callback_query.message.edit_text("Список проектов:", reply_markup=keyboard)
 
-@dp.callback_query(lambda c: c.data == "new_order")
+@callbacks.route(NewOrder)
 async def process_new_order(callback_query: CallbackQuery, state: FSMContext):
     await callback_query.message.edit_text("Введите название заказа:")
     await state.set_state(OrderForm.title)
@@ -157,83 +291,118 @@ async def process_description(message: Message, state: FSMContext):
         title=data["title"],
         description=message.text
     )
+    await invalidate_projects()
     
     await message.reply(f"Проект успешно создан!\n\nНазвание: {order.title}\nОписание: {order.description}")
     await state.clear()
 
-@dp.callback_query(lambda c: c.data.startswith("task_"))
-async def take_task(callback_query: CallbackQuery):
-    parts = callback_query.data.split('_')
-    task_type_key = parts[1]
-    order_id = int(parts[2])
+@callbacks.route(TakeTask)
+async def take_task(callback_query: CallbackQuery, callback_data: TakeTask):
+    order_id = callback_data.order_id
     user_id = str(callback_query.from_user.id)
-    task_type = TASK_TYPE_MAP.get(task_type_key, task_type_key)
+    task_type = TASK_TYPES_BY_KEY.get(callback_data.task_type)
+    if task_type is None:
+        await callback_query.answer("Такого типа задач больше нет", show_alert=True)
+        return
 
-    # Проверяем, не взял ли уже кто-то эту задачу по этому заказу
-    existing = await Task.filter(order_id=order_id, task_type=task_type).first()
-    if existing:
-        if existing.user_id == user_id:
+    # Берём задачу одной вставкой: уникальный ключ (order, task_type) не даст взять её дважды
+    task, owner = await claim_task(order_id, task_type.code, user_id)
+    # Карточка могла показать устаревшую занятость — сбрасываем доску в любом случае
+    await invalidate_task_board(order_id)
+    if task is None:
+        if owner is None:
+            await callback_query.answer("Проект не найден. Откройте список проектов заново.", show_alert=True)
+        elif owner == user_id:
             await callback_query.answer("Вы уже взялись за эту задачу", show_alert=True)
         else:
-            await callback_query.answer("Эта задача уже занята другим пользователем", show_alert=True)
+            await callback_query.answer(f"Эта задача уже занята пользователем {owner}", show_alert=True)
         return
-    # Создаем задачу
-    await Task.create(order_id=order_id, user_id=user_id, task_type=task_type)
-    await callback_query.answer(f"Вы взялись за: {task_type}", show_alert=True)
+    await callback_query.answer(f"Вы взялись за: {task_type.label}", show_alert=True)
+
+# Обрезает текст пользователя (причину отклонения и т.п.), чтобы сообщение уложилось в лимит Telegram
+def shorten(text, limit):
+    if len(text) <= limit:
+        return text
+    return text[:max(limit - 1, 0)] + "…"
+
+# Собирает строки отчёта в сообщения не длиннее MESSAGE_LIMIT и отправляет их по мере заполнения.
+# Первое сообщение уходит через send_first, остальные через send_next. Возвращает число сообщений.
+async def send_chunked(lines, send_first, send_next):
+    sent = 0
+    chunk = []
+    chunk_len = 0
+    async for line in lines:
+        line = line[:MESSAGE_LIMIT]
+        if chunk and chunk_len + len(line) > MESSAGE_LIMIT:
+            await (send_next if sent else send_first)("".join(chunk))
+            sent += 1
+            chunk = []
+            chunk_len = 0
+        chunk.append(line)
+        chunk_len += len(line)
+    if chunk:
+        await (send_next if sent else send_first)("".join(chunk))
+        sent += 1
+    return sent
+
+# Строки отчёта, сгруппированные по проектам. Заголовок отдаётся только если есть хоть одна задача.
+async def task_report_lines(header, format_task, **filters):
+    current_order = None
+    async for rows in iter_task_rows(**filters):
+        for row in rows:
+            if current_order is None:
+                yield header
+            elif row['order_id'] != current_order:
+                yield "\n"
+            if row['order_id'] != current_order:
+                current_order = row['order_id']
+                yield f"Проект: <b>{row['order__title']}</b>\n"
+            yield format_task(row)
+    if current_order is not None:
+        yield "\n"
+
+def format_my_task(row):
+    status_text = ""
+    if row['status'] == TaskStatus.APPROVED:
+        status_text = " (Выполнено ✅)"
+    elif row['status'] == TaskStatus.REJECTED:
+        status_text = " (Требуются доработки ❌)"
+    # Для статуса PENDING ничего не добавляем
+    return f"  - {task_type_label(row['task_type'])}{status_text}\n"
+
+def format_admin_task(row):
+    return f"{task_type_label(row['task_type'])}: <a href=\"tg://user?id={row['user_id']}\">{row['user_id']}</a>\n"
 
 @dp.message(lambda message: message.text == "📝 Мои задачи")
 async def my_tasks(message: Message):
     user_id = str(message.from_user.id)
-    # Получаем задачи пользователя, предварительно загружая информацию о проекте
-    tasks = await Task.filter(user_id=user_id).prefetch_related('order')
-    if not tasks:
+    # Задачи читаются пачками и уходят несколькими сообщениями, если не влезают в одно.
+    # Все части идут через delivery: длинный отчёт не упрётся в лимит сообщений в чат
+    chat_id = message.chat.id
+    sent = await send_chunked(
+        task_report_lines("Ваши задачи:\n\n", format_my_task, user_id=user_id),
+        lambda text: delivery.call(chat_id, lambda: message.reply(text, parse_mode="HTML")),
+        lambda text: delivery.send_message(chat_id, text, parse_mode="HTML"),
+    )
+    if not sent:
         await message.reply("У вас нет активных задач")
-        return
-    
-    # Группируем задачи по проектам и собираем информацию о статусе
-    project_tasks_info = defaultdict(list) # {project_title: [(task_type, status)]}
-    for task in tasks:
-        project_tasks_info[task.order.title].append((task.task_type, task.status))
-    
-    text = "Ваши задачи:\n\n"
-    for project, task_list in project_tasks_info.items():
-        text += f"Проект: <b>{project}</b>\n"
-        for task_type, status in task_list:
-            status_text = ""
-            if status == 'approved':
-                status_text = " (Выполнено ✅)"
-            elif status == 'rejected':
-                status_text = " (Требуются доработки ❌)"
-            # Для статуса 'pending' ничего не добавляем
-                
-            text += f"  - {task_type}{status_text}\n"
-        text += "\n"
-        
-    await message.reply(text, parse_mode="HTML")
 
-@dp.callback_query(lambda c: c.data == "admin_tasks")
+@callbacks.route(AdminTasks)
 async def admin_tasks(callback_query: CallbackQuery):
-    tasks = await Task.all().prefetch_related('order')
-    if not tasks:
+    chat_id = callback_query.message.chat.id
+    sent = await send_chunked(
+        task_report_lines("Список задач пользователей:\n\n", format_admin_task),
+        lambda text: delivery.call(chat_id, lambda: callback_query.message.edit_text(text, parse_mode="HTML")),
+        lambda text: delivery.send_message(chat_id, text, parse_mode="HTML"),
+    )
+    if not sent:
         await callback_query.message.edit_text("Нет активных задач пользователей")
-        return
-    # Группируем задачи по проектам и категориям
-    project_tasks = defaultdict(list)
-    for task in tasks:
-        project_tasks[task.order.title].append((task.task_type, task.user_id))
-    text = "Список задач пользователей:\n\n"
-    for project, task_list in project_tasks.items():
-        text += f"Проект: <b>{project}</b>\n"
-        for task_type, user_id in task_list:
-            text += f"{task_type}: <a href=\"tg://user?id={user_id}\">{user_id}</a>\n"
-        text += "\n"
-    await callback_query.message.edit_text(text, parse_mode="HTML")
 
 @dp.message(lambda message: message.text == "📤 Сдать работу")
 async def submit_work_start(message: Message, state: FSMContext):
     user_id = str(message.from_user.id)
     # Получаем задачи пользователя, которые НЕ одобрены
-    tasks = await Task.filter(user_id=user_id, status__not='approved').prefetch_related('order')
+    tasks = await Task.filter(user_id=user_id, status__not=TaskStatus.APPROVED).prefetch_related('order')
 
     if not tasks:
         await message.reply("У вас нет задач для сдачи работы (или все задачи уже одобрены).")
@@ -243,7 +412,7 @@ async def submit_work_start(message: Message, state: FSMContext):
     projects = {task.order.id: task.order.title for task in tasks}
     keyboard = InlineKeyboardMarkup(
         inline_keyboard=[
-            [InlineKeyboardButton(text=title, callback_data=f"submit_proj_{proj_id}")]
+            [InlineKeyboardButton(text=title, callback_data=SubmitProject(order_id=proj_id).pack())]
             for proj_id, title in projects.items()
         ]
     )
@@ -251,14 +420,14 @@ async def submit_work_start(message: Message, state: FSMContext):
     await state.set_state(SubmitWorkForm.select_project)
     await state.update_data(tasks=[{'id': t.id, 'order_id': t.order.id, 'order_title': t.order.title, 'task_type': t.task_type} for t in tasks])
 
-@dp.callback_query(lambda c: c.data.startswith("submit_proj_"), SubmitWorkForm.select_project)
-async def submit_work_select_project(callback_query: CallbackQuery, state: FSMContext):
-    project_id = int(callback_query.data.split("_")[-1])
+@callbacks.route(SubmitProject, SubmitWorkForm.select_project)
+async def submit_work_select_project(callback_query: CallbackQuery, callback_data: SubmitProject, state: FSMContext):
+    project_id = callback_data.order_id
     data = await state.get_data()
     user_tasks = [t for t in data['tasks'] if t['order_id'] == project_id]
     keyboard = InlineKeyboardMarkup(
         inline_keyboard=[
-            [InlineKeyboardButton(text=t['task_type'], callback_data=f"submit_task_{t['id']}")]
+            [InlineKeyboardButton(text=task_type_label(t['task_type']), callback_data=SubmitTask(task_id=t['id']).pack())]
             for t in user_tasks
         ]
     )
@@ -266,16 +435,16 @@ async def submit_work_select_project(callback_query: CallbackQuery, state: FSMCo
     await state.set_state(SubmitWorkForm.select_task)
     await state.update_data(selected_project=project_id)
 
-@dp.callback_query(lambda c: c.data.startswith("submit_task_"), SubmitWorkForm.select_task)
-async def submit_work_select_task(callback_query: CallbackQuery, state: FSMContext):
-    task_id = int(callback_query.data.split("_")[-1])
+@callbacks.route(SubmitTask, SubmitWorkForm.select_task)
+async def submit_work_select_task(callback_query: CallbackQuery, callback_data: SubmitTask, state: FSMContext):
+    task_id = callback_data.task_id
     await state.update_data(selected_task=task_id, files=[])
     
     # Кнопки для отправки на проверку и Назад
     keyboard = InlineKeyboardMarkup(
         inline_keyboard=[
-            [InlineKeyboardButton(text="Отправить на проверку", callback_data="submit_confirm")],
-            [InlineKeyboardButton(text="⬅️ Назад", callback_data="submit_back_to_tasks")] # Кнопка Назад
+            [InlineKeyboardButton(text="Отправить на проверку", callback_data=SubmitConfirm().pack())],
+            [InlineKeyboardButton(text="⬅️ Назад", callback_data=SubmitBack().pack())] # Кнопка Назад
         ]
     )
 
@@ -285,10 +454,29 @@ async def submit_work_select_task(callback_query: CallbackQuery, state: FSMConte
     await callback_query.message.answer("Загрузите файлы, затем нажмите:", reply_markup=keyboard)
     await state.set_state(SubmitWorkForm.upload_files)
 
+# Дописывает файлы в состояние одной записью. Блокировка по пользователю не даёт параллельным
+# сообщениям потерять файлы друг друга. Возвращает общее число файлов или None, если
+# пользователь уже вышел из загрузки.
+async def append_files(state: FSMContext, files):
+    async with user_lock(state.key):
+        if await state.get_state() != SubmitWorkForm.upload_files.state:
+            return None
+        data = await state.get_data()
+        all_files = data.get('files', []) + files
+        await state.update_data(files=all_files)
+        return len(all_files)
+
+# Альбом сохраняется целиком: одна запись в состояние и один ответ на первое сообщение альбома
+async def save_album(context, files):
+    state, message = context
+    total = await append_files(state, files)
+    if total is not None:
+        await message.reply(f"Добавлено файлов из альбома: {len(files)}, всего {total}. Можете добавить ещё или нажмите 'Отправить на проверку'.")
+
+albums = AlbumCollector(save_album)
+
 @dp.message(SubmitWorkForm.upload_files, F.content_type.in_(["document", "photo", "video"]))
 async def submit_work_upload_file(message: Message, state: FSMContext):
-    data = await state.get_data()
-    files = data.get('files', [])
     file_info = None
     if message.document:
         file_info = {'file_id': message.document.file_id, 'type': 'document'}
@@ -298,126 +486,114 @@ async def submit_work_upload_file(message: Message, state: FSMContext):
     elif message.video:
         file_info = {'file_id': message.video.file_id, 'type': 'video'}
     
-    if file_info:
-        files.append(file_info)
-        await state.update_data(files=files)
-        await message.reply("Файл добавлен. Можете добавить ещё или нажмите 'Отправить на проверку'.")
-    else:
-         # Это сообщение, скорее всего, не будет достигнуто из-за фильтра F, но на всякий случай.
-         await message.reply("Пожалуйста, прикрепите документ, фото или видео.")
-
-@dp.callback_query(lambda c: c.data == "submit_confirm", SubmitWorkForm.upload_files)
-async def submit_work_confirm(callback_query: CallbackQuery, state: FSMContext):
-    data = await state.get_data()
-    files_to_save = data.get('files', [])
-    task_id = data.get('selected_task')
+    if not file_info:
+        # Это сообщение, скорее всего, не будет достигнуто из-за фильтра F, но на всякий случай.
+        await message.reply("Пожалуйста, прикрепите документ, фото или видео.")
+        return
 
-    if not files_to_save:
-        await callback_query.answer("Сначала прикрепите хотя бы один файл!", show_alert=True)
+    if message.media_group_id:
+        # Сообщения альбома копятся и сохраняются пачкой после паузы ALBUM_DEBOUNCE
+        albums.add(state.key, message.media_group_id, file_info, (state, message))
         return
-    
-    # Получаем объект задачи
-    task = await Task.get(id=task_id)
-
-    # Сохраняем информацию о файлах в базе данных
-    saved_count = 0
-    for file_info in files_to_save:
-        # Проверяем, не был ли этот файл уже прикреплен к этой задаче
-        existing_file = await SubmittedFile.filter(task=task, file_id=file_info['file_id']).first()
-        if not existing_file:
-            await SubmittedFile.create(
-                task=task,
-                file_id=file_info['file_id'],
-                file_type=file_info['type']
-            )
-            saved_count += 1
+
+    total = await append_files(state, [file_info])
+    if total is not None:
+        await message.reply(f"Файл добавлен, всего {total}. Можете добавить ещё или нажмите 'Отправить на проверку'.")
+
+@callbacks.route(SubmitConfirm, SubmitWorkForm.upload_files)
+async def submit_work_confirm(callback_query: CallbackQuery, state: FSMContext):
+    # Альбом, который ещё досылается или уже сохраняется, должен попасть в эту сдачу
+    await albums.flush_user(state.key)
+    # Под той же блокировкой, что и дописывание файлов: между чтением списка и очисткой
+    # состояния ни один файл не допишется мимо сдачи
+    async with user_lock(state.key):
+        data = await state.get_data()
+        files_to_save = data.get('files', [])
+        task_id = data.get('selected_task')
+
+        if not files_to_save:
+            await callback_query.answer("Сначала прикрепите хотя бы один файл!", show_alert=True)
+            return
+
+        # Сохраняем информацию о файлах в базе данных одной транзакцией
+        saved_count, version = await save_submitted_files(task_id, files_to_save)
+        await state.clear() # Очищаем состояние после сохранения
 
     if saved_count > 0:
-        await callback_query.message.edit_text(f"Работа ({saved_count} новых файл(а/ов)) прикреплена к задаче.\nОжидайте проверки администратором.")
+        await callback_query.message.edit_text(f"Работа ({saved_count} новых файл(а/ов)) прикреплена к задаче, версия {version}.\nОжидайте проверки администратором.")
     else:
-         await callback_query.message.edit_text("Выбранные файлы уже были прикреплены к этой задаче.")
-         
-    await state.clear() # Очищаем состояние после сохранения
+         await callback_query.message.edit_text(f"Выбранные файлы уже были прикреплены к версии {version} этой задачи.")
 
-@dp.callback_query(lambda c: c.data == "admin_completed_tasks_start")
+@callbacks.route(ReviewProjects)
 async def admin_completed_tasks_start(callback_query: CallbackQuery):
-    # Находим все задачи, у которых есть прикрепленные файлы
-    tasks_with_files = await Task.filter(submitted_files__isnull=False).distinct().prefetch_related('order')
+    # Проекты со сданными файлами берутся из сводки: одна строка на проект, без соединений
+    projects = await get_projects_with_files()
     
-    if not tasks_with_files:
+    if not projects:
         await callback_query.message.edit_text("Нет выполненных задач с прикрепленными файлами.")
         return
-    
-    # Группируем задачи по проектам
-    projects = {}
-    for task in tasks_with_files:
-        if task.order.id not in projects:
-            projects[task.order.id] = task.order.title
             
     keyboard = InlineKeyboardMarkup(
         inline_keyboard=[
-            [InlineKeyboardButton(text=title, callback_data=f"admin_completed_proj_{proj_id}")]
-            for proj_id, title in projects.items()
-        ]
+            [InlineKeyboardButton(text=project['title'], callback_data=ReviewProject(order_id=project['order_id']).pack())]
+            for project in projects
+        ] + [[InlineKeyboardButton(text="☑️ Массовая проверка всех проектов", callback_data=BulkOpen().pack())]]
     )
     
     await callback_query.message.edit_text("Выберите проект для просмотра выполненных задач:", reply_markup=keyboard)
 
 # Вспомогательная функция для отображения выполненных задач по проекту
 async def display_completed_tasks_for_project(message, project_id):
-    # Находим все задачи для этого проекта, у которых есть прикрепленные файлы
-    tasks_with_files = await Task.filter(order_id=project_id, submitted_files__isnull=False).distinct().prefetch_related('order')
+    # Сводка проекта — одна строка с задачами всех типов, числом файлов и временем загрузки
+    progress = await get_progress(project_id)
     
-    if not tasks_with_files:
+    if not progress or not progress.files:
         await message.edit_text("В этом проекте нет выполненных задач с прикрепленными файлами.")
         return
     
-    project_title = tasks_with_files[0].order.title # Название проекта одно для всех задач
-    
-    text = f"Задачи с прикрепленными файлами в проекте \"{project_title}\"\n\n"
+    text = f"Задачи с прикрепленными файлами в проекте \"{progress.title}\"\n\n"
     keyboard_buttons = []
     
-    # Группируем задачи по типу и исполнителю (т.е. уникальные задачи)
-    unique_tasks = defaultdict(dict) # {user_id: {task_type: task_object}}
-    for task in tasks_with_files:
-        unique_tasks[task.user_id][task.task_type] = task
+    # Группируем задачи со сданными файлами по исполнителю; файлы и время — последней версии
+    unique_tasks = defaultdict(dict) # {user_id: {название типа: task}}
+    for code, task in progress.tasks.items():
+        if task['files']:
+            unique_tasks[task['user_id']][task_type_label(int(code))] = task
 
     for user_id, tasks_by_type in unique_tasks.items():
         user_link = f"<a href=\"tg://user?id={user_id}\">{user_id}</a>"
         text += f"Исполнитель: {user_link}\n"
         for task_type, task in tasks_by_type.items():
-            status_text = {
-                'pending': 'Ожидает одобрения ⏳',
-                'approved': 'Одобрено ✅',
-                'rejected': 'Отклонено ❌'
-            }.get(task.status, task.status) # Отображаем статус с эмодзи
+            status_text = STATUS_LABELS[TaskStatus(task['status'])] # Отображаем статус с эмодзи
+            uploaded = datetime.fromisoformat(task['last_upload']).strftime('%d.%m.%Y %H:%M')
             
-            text += f"  - {task_type} ({status_text})\n"
+            text += f"  - {task_type} ({status_text}), версия {task['version']}, файлов: {task['files']}, загружено {uploaded}\n"
             # Кнопка для просмотра файлов конкретной задачи пользователя
             keyboard_buttons.append(
-                [InlineKeyboardButton(text=f"📂 Файлы {task_type} от {user_id}", callback_data=f"admin_view_task_files_{task.id}")]
+                [InlineKeyboardButton(text=f"📂 Файлы {task_type} от {user_id}", callback_data=TaskFiles(task_id=task['id']).pack())]
             )
         text += "\n"
     
-    keyboard_buttons.append([InlineKeyboardButton(text="⬅️ Назад к проектам", callback_data="admin_completed_tasks_start")])
+    keyboard_buttons.append([InlineKeyboardButton(text="☑️ Массовая проверка", callback_data=BulkOpen(order_id=project_id).pack())])
+    keyboard_buttons.append([InlineKeyboardButton(text="⬅️ Назад к проектам", callback_data=ReviewProjects().pack())])
     
     keyboard = InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
     
     await message.edit_text(text, reply_markup=keyboard, parse_mode="HTML")
 
-@dp.callback_query(lambda c: c.data.startswith("admin_completed_proj_"))
-async def admin_completed_tasks_select_project(callback_query: CallbackQuery):
-    project_id = int(callback_query.data.split("_")[-1])
-    await display_completed_tasks_for_project(callback_query.message, project_id)
+@callbacks.route(ReviewProject)
+async def admin_completed_tasks_select_project(callback_query: CallbackQuery, callback_data: ReviewProject):
+    await display_completed_tasks_for_project(callback_query.message, callback_data.order_id)
 
-# НОВЫЙ ОБРАБОТЧИК для просмотра файлов конкретной задачи
-@dp.callback_query(lambda c: c.data.startswith("admin_view_task_files_"))
-async def admin_view_task_files(callback_query: CallbackQuery):
-    task_id = int(callback_query.data.split("_")[-1])
-    
-    task = await Task.get(id=task_id).prefetch_related('submitted_files', 'order')
+# НОВЫЙ ОБРАБОТЧИК для просмотра файлов конкретной задачи.
+# Отправляется только последняя версия сдачи; предыдущие — по кнопке истории
+@callbacks.route(TaskFiles)
+async def admin_view_task_files(callback_query: CallbackQuery, callback_data: TaskFiles):
+    task = await Task.get(id=callback_data.task_id).prefetch_related('order')
+    submission = await get_submission(task.id)
+    files = await get_version_files(task.id, submission.version) if submission else []
     
-    if not task.submitted_files:
+    if not files:
         await callback_query.answer("Для этой задачи нет прикрепленных файлов.", show_alert=True)
         # Вернуться к списку задач проекта
         await display_completed_tasks_for_project(callback_query.message, task.order.id) # Используем новую вспомогательную функцию
@@ -425,73 +601,123 @@ async def admin_view_task_files(callback_query: CallbackQuery):
         
     await callback_query.answer("Отправляю файлы задачи...", show_alert=True)
     
-    media_group_items = []
-    document_items = []
-    
     project_title = task.order.title
-    caption_text = f"Файлы для задачи \"{task.task_type}\" в проекте \"{project_title}\" от пользователя <a href=\"tg://user?id={task.user_id}\">{task.user_id}</a>"
-
-    for file_info in task.submitted_files:
-        if file_info.file_type == 'photo':
-            media_group_items.append(InputMediaPhoto(media=file_info.file_id))
-        elif file_info.file_type == 'video':
-            media_group_items.append(InputMediaVideo(media=file_info.file_id))
-        elif file_info.file_type == 'document':
-            document_items.append(file_info.file_id)
-
-    # Отправляем медиа-группу
-    if media_group_items:
-        # Первому элементу медиа-группы можно добавить подпись
-        media_group_items[0].caption = caption_text
-        media_group_items[0].parse_mode = "HTML"
-        await bot.send_media_group(callback_query.message.chat.id, media_group_items)
-        
-    # Отправляем документы отдельно
-    for doc_file_id in document_items:
-        await bot.send_document(callback_query.message.chat.id, doc_file_id)
+    caption_text = f"Файлы для задачи \"{task_type_label(task.task_type)}\" в проекте \"{project_title}\" от пользователя <a href=\"tg://user?id={task.user_id}\">{task.user_id}</a>, версия {submission.version}"
+    if submission.version > 1:
+        # Что исправлялось: причина отклонения предыдущей версии
+        previous = await get_submission(task.id, submission.version - 1)
+        if previous and previous.reject_reason:
+            # Полная причина — в истории версий, в подпись идёт сколько поместится
+            prefix = "\nПрошлая версия отклонена: "
+            reason = shorten(previous.reject_reason, CAPTION_LIMIT - len(caption_text) - len(prefix))
+            caption_text += prefix + html.escape(reason)
+
+    # Медиа-группы по 10 элементов (фото/видео и документы отдельно) с учётом лимитов Telegram
+    await delivery.send_files(
+        callback_query.message.chat.id,
+        files,
+        caption=caption_text,
+        parse_mode="HTML",
+    )
         
     # Кнопки Одобрить/Отклонить после отправки файлов
-    approve_reject_keyboard = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [InlineKeyboardButton(text="✅ Одобрить", callback_data=f"admin_approve_task_{task.id}")],
-            [InlineKeyboardButton(text="❌ Отклонить", callback_data=f"admin_reject_task_{task.id}")]
-        ]
+    keyboard_buttons = [
+        [InlineKeyboardButton(text="✅ Одобрить", callback_data=ApproveTask(task_id=task.id).pack())],
+        [InlineKeyboardButton(text="❌ Отклонить", callback_data=RejectTask(task_id=task.id).pack())]
+    ]
+    if submission.version > 1:
+        keyboard_buttons.append([InlineKeyboardButton(text="🕘 Предыдущие версии", callback_data=TaskHistory(task_id=task.id).pack())])
+    approve_reject_keyboard = InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
+    await delivery.send_message(callback_query.message.chat.id, "Выберите действие по этой задаче:", reply_markup=approve_reject_keyboard)
+
+# История сдач задачи: версии со статусом и причиной отклонения, без загрузки файлов
+@callbacks.route(TaskHistory)
+async def admin_task_history(callback_query: CallbackQuery, callback_data: TaskHistory):
+    if str(callback_query.from_user.id) not in ADMIN_ID:
+        await callback_query.answer("У вас нет прав администратора", show_alert=True)
+        return
+
+    submissions = await get_submissions(callback_data.task_id)
+    if not submissions:
+        await callback_query.answer("У этой задачи нет сдач.", show_alert=True)
+        return
+
+    async def history_lines():
+        yield "История сдач задачи:\n\n"
+        for submission in submissions:
+            status_text = STATUS_LABELS[TaskStatus(submission['status'])]
+            yield f"Версия {submission['version']} ({status_text}), файлов: {submission['files']}, сдана {submission['created_at'].strftime('%d.%m.%Y %H:%M')}\n"
+            if submission['reject_reason']:
+                yield f"  Причина отклонения: {submission['reject_reason']}\n"
+
+    # Длинные причины отклонения не должны упираться в лимит сообщения: история режется на части,
+    # кнопки версий уходят отдельным сообщением после неё
+    chat_id = callback_query.message.chat.id
+    send = lambda text: delivery.send_message(chat_id, text)
+    await send_chunked(history_lines(), send, send)
+    keyboard_buttons = [
+        [InlineKeyboardButton(
+            text=f"📂 Файлы версии {submission['version']}",
+            callback_data=TaskVersion(task_id=callback_data.task_id, version=submission['version']).pack()
+        )]
+        for submission in submissions
+    ]
+    await delivery.send_message(
+        chat_id, "Файлы какой версии показать?", reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
+    )
+    await callback_query.answer()
+
+# Файлы одной версии догружаются только по запросу; кнопок проверки нет — проверяется последняя версия
+@callbacks.route(TaskVersion)
+async def admin_view_version_files(callback_query: CallbackQuery, callback_data: TaskVersion):
+    if str(callback_query.from_user.id) not in ADMIN_ID:
+        await callback_query.answer("У вас нет прав администратора", show_alert=True)
+        return
+
+    files = await get_version_files(callback_data.task_id, callback_data.version)
+    if not files:
+        await callback_query.answer("В этой версии нет файлов.", show_alert=True)
+        return
+
+    await callback_query.answer("Отправляю файлы версии...")
+    await delivery.send_files(
+        callback_query.message.chat.id,
+        files,
+        caption=f"Версия {callback_data.version}",
     )
-    await bot.send_message(callback_query.message.chat.id, "Выберите действие по этой задаче:", reply_markup=approve_reject_keyboard)
 
 # НОВЫЙ ОБРАБОТЧИК для одобрения задачи
-@dp.callback_query(lambda c: c.data.startswith("admin_approve_task_"))
-async def admin_approve_task(callback_query: CallbackQuery):
-    task_id = int(callback_query.data.split("_")[-1])
-    
-    task = await Task.get(id=task_id).prefetch_related('order')
-    task.status = 'approved'
-    # Также можно установить is_completed в True, если одобрение означает завершение
-    task.is_completed = True
-    await task.save()
+@callbacks.route(ApproveTask)
+async def admin_approve_task(callback_query: CallbackQuery, callback_data: ApproveTask):
+    task = await Task.get(id=callback_data.task_id).prefetch_related('order')
+    # Статус и уведомление исполнителю фиксируются одной транзакцией, отправит их outbox
+    async with in_transaction() as conn:
+        task.status = TaskStatus.APPROVED
+        # Также можно установить is_completed в True, если одобрение означает завершение
+        task.is_completed = True
+        await task.save(using_db=conn)
+        await review_submissions([task.id], TaskStatus.APPROVED, conn)
+        await refresh_progress([task.order_id], conn)
+        await enqueue_notification(task.user_id, f"✅ Ваша задача '{task_type_label(task.task_type)}' в проекте '{task.order.title}' одобрена администратором.", using_db=conn)
+    outbox.wake()
+    await invalidate_task_board(task.order_id)
     
     await callback_query.answer("Задача одобрена!", show_alert=True)
-    
-    # Опционально: отправить сообщение пользователю, что его задача одобрена
-    try:
-        await bot.send_message(int(task.user_id), f"✅ Ваша задача '{task.task_type}' в проекте '{task.order.title}' одобрена администратором.")
-    except Exception as e:
-        print(f"Не удалось отправить уведомление пользователю {task.user_id}: {e}")
         
     # Вернуться к списку задач проекта
     await display_completed_tasks_for_project(callback_query.message, task.order.id) # Используем новую вспомогательную функцию
 
 # НОВЫЙ ОБРАБОТЧИК для отклонения задачи
-@dp.callback_query(lambda c: c.data.startswith("admin_reject_task_"))
-async def admin_reject_task(callback_query: CallbackQuery, state: FSMContext):
-    task_id = int(callback_query.data.split("_")[-1])
+@callbacks.route(RejectTask)
+async def admin_reject_task(callback_query: CallbackQuery, callback_data: RejectTask, state: FSMContext):
+    task_id = callback_data.task_id
     
     # Сохраняем ID задачи в состоянии для последующего использования
     await state.update_data(reject_task_id=task_id)
     
     # Добавляем кнопки "Пропустить" и "Назад"
-    keyboard = InlineKeyboardButton(text="Пропустить", callback_data="admin_reject_skip")
-    back_button = InlineKeyboardButton(text="⬅️ Назад", callback_data=f"admin_reject_back_{task_id}")
+    keyboard = InlineKeyboardButton(text="Пропустить", callback_data=RejectSkip().pack())
+    back_button = InlineKeyboardButton(text="⬅️ Назад", callback_data=RejectBack(task_id=task_id).pack())
     approve_reject_keyboard = InlineKeyboardMarkup(
         inline_keyboard=[
             [keyboard],
@@ -518,35 +744,37 @@ async def process_reject_reason(message: Message, state: FSMContext):
         return
 
     task = await Task.get(id=task_id).prefetch_related('order')
-    task.status = 'rejected'
-    task.is_completed = False # Отклоненная задача не считается выполненной
-    await task.save()
+    # Отклонение и уведомление с причиной фиксируются одной транзакцией
+    async with in_transaction() as conn:
+        task.status = TaskStatus.REJECTED
+        task.is_completed = False # Отклоненная задача не считается выполненной
+        await task.save(using_db=conn)
+        # Причина остаётся в версии — её видно в истории и при проверке следующей версии
+        await review_submissions([task.id], TaskStatus.REJECTED, conn, reason=reject_reason)
+        await refresh_progress([task.order_id], conn)
+        header = f"❌ Ваша задача '{task_type_label(task.task_type)}' в проекте '{task.order.title}' была отклонена администратором.\n\nПричина: "
+        footer = "\n\nПожалуйста, проверьте предоставленные файлы и внесите необходимые исправления." # Или другое указание
+        # Иначе длинная причина не уложится в сообщение и outbox пометит уведомление failed
+        reason = shorten(reject_reason or "", MESSAGE_LIMIT - len(header) - len(footer))
+        await enqueue_notification(task.user_id, header + reason + footer, using_db=conn)
+    outbox.wake()
+    await invalidate_task_board(task.order_id)
     
     await message.reply("Причина отклонения принята. Задача отклонена.")
-
-    # Отправить сообщение пользователю, что его задача отклонена, с указанием причины
-    try:
-        await bot.send_message(int(task.user_id), 
-            f"❌ Ваша задача '{task.task_type}' в проекте '{task.order.title}' была отклонена администратором.\n\n"
-            f"Причина: {reject_reason}\n\n"
-            f"Пожалуйста, проверьте предоставленные файлы и внесите необходимые исправления." # Или другое указание
-        )
-    except Exception as e:
-        print(f"Не удалось отправить уведомление пользователю {task.user_id}: {e}")
         
     await state.clear()
     
     # После отклонения и уведомления вернуться к списку задач проекта
     return_keyboard = InlineKeyboardMarkup(
         inline_keyboard=[
-            [InlineKeyboardButton(text="⬅️ Вернуться к задачам проекта", callback_data=f"admin_completed_proj_{task.order.id}")],
-            [InlineKeyboardButton(text="⬅️ Вернуться в админ панель", callback_data="admin")]
+            [InlineKeyboardButton(text="⬅️ Вернуться к задачам проекта", callback_data=ReviewProject(order_id=task.order.id).pack())],
+            [InlineKeyboardButton(text="⬅️ Вернуться в админ панель", callback_data=AdminPanel().pack())]
         ]
     )
     await message.answer("Дальнейшие действия:", reply_markup=return_keyboard)
 
 # НОВЫЙ ОБРАБОТЧИК для кнопки "Пропустить" при отклонении
-@dp.callback_query(lambda c: c.data == "admin_reject_skip", AdminRejectTaskForm.reason)
+@callbacks.route(RejectSkip, AdminRejectTaskForm.reason)
 async def admin_reject_skip(callback_query: CallbackQuery, state: FSMContext):
     data = await state.get_data()
     task_id = data.get('reject_task_id')
@@ -557,31 +785,169 @@ async def admin_reject_skip(callback_query: CallbackQuery, state: FSMContext):
         return
     
     task = await Task.get(id=task_id).prefetch_related('order')
-    task.status = 'rejected'
-    task.is_completed = False
-    await task.save()
+    # Отклонение и стандартное уведомление фиксируются одной транзакцией
+    async with in_transaction() as conn:
+        task.status = TaskStatus.REJECTED
+        task.is_completed = False
+        await task.save(using_db=conn)
+        await review_submissions([task.id], TaskStatus.REJECTED, conn)
+        await refresh_progress([task.order_id], conn)
+        await enqueue_notification(task.user_id, f"❌ Ваша задача '{task_type_label(task.task_type)}' в проекте '{task.order.title}' была отклонена администратором. Пожалуйста, проверьте предоставленные файлы.", using_db=conn)
+    outbox.wake()
+    await invalidate_task_board(task.order_id)
     
     await callback_query.message.edit_text("Причина не указана. Задача отклонена.")
-
-    # Отправить стандартное сообщение пользователю об отклонении
-    try:
-        await bot.send_message(int(task.user_id), f"❌ Ваша задача '{task.task_type}' в проекте '{task.order.title}' была отклонена администратором. Пожалуйста, проверьте предоставленные файлы.")
-    except Exception as e:
-        print(f"Не удалось отправить уведомление пользователю {task.user_id}: {e}")
         
     await state.clear()
     
     # Вернуться к списку задач проекта
     return_keyboard = InlineKeyboardMarkup(
         inline_keyboard=[
-            [InlineKeyboardButton(text="⬅️ Вернуться к задачам проекта", callback_data=f"admin_completed_proj_{task.order.id}")],
-            [InlineKeyboardButton(text="⬅️ Вернуться в админ панель", callback_data="admin")]
+            [InlineKeyboardButton(text="⬅️ Вернуться к задачам проекта", callback_data=ReviewProject(order_id=task.order.id).pack())],
+            [InlineKeyboardButton(text="⬅️ Вернуться в админ панель", callback_data=AdminPanel().pack())]
         ]
     )
     await callback_query.message.answer("Дальнейшие действия:", reply_markup=return_keyboard)
 
+# Кнопка "Назад" на вводе причины: отклонение отменяется, возвращаемся к задачам проекта
+@callbacks.route(RejectBack)
+async def admin_reject_back(callback_query: CallbackQuery, callback_data: RejectBack, state: FSMContext):
+    await state.clear()
+    task = await Task.get_or_none(id=callback_data.task_id)
+    if task is None:
+        await callback_query.message.edit_text("Задача не найдена.")
+        return
+    await display_completed_tasks_for_project(callback_query.message, task.order_id)
+    await callback_query.answer()
+
+@callbacks.route(AdminPanel)
+async def admin_panel(callback_query: CallbackQuery):
+    if str(callback_query.from_user.id) not in ADMIN_ID:
+        await callback_query.answer("У вас нет прав администратора", show_alert=True)
+        return
+
+    await callback_query.message.edit_text("Админ панель", reply_markup=ADMIN_KEYBOARD)
+    await callback_query.answer()
+
+# Экран массовой проверки строится из данных состояния, без запросов к базе
+async def render_bulk_review(message, state: FSMContext):
+    data = await state.get_data()
+    tasks = data['bulk_tasks']
+    selected = set(data['bulk_selected'])
+
+    keyboard_buttons = [
+        [InlineKeyboardButton(
+            text=f"{'✅' if t['id'] in selected else '⬜'} {t['order__title']} · {task_type_label(t['task_type'])} · {t['user_id']}",
+            callback_data=BulkToggle(task_id=t['id']).pack()
+        )]
+        for t in tasks
+    ]
+    keyboard_buttons.append([
+        InlineKeyboardButton(text="Выбрать все", callback_data=BulkSelect(mode="all").pack()),
+        InlineKeyboardButton(text="Снять выбор", callback_data=BulkSelect(mode="none").pack()),
+    ])
+    keyboard_buttons.append([
+        InlineKeyboardButton(text="✅ Одобрить выбранные", callback_data=BulkApply(action="approve").pack()),
+        InlineKeyboardButton(text="❌ Отклонить выбранные", callback_data=BulkApply(action="reject").pack()),
+    ])
+    keyboard_buttons.append([InlineKeyboardButton(text="⬅️ Назад к проектам", callback_data=ReviewProjects().pack())])
+
+    await message.edit_text(
+        f"Массовая проверка: выбрано {len(selected)} из {len(tasks)}.\n\nОтметьте задачи и выберите действие.",
+        reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
+    )
+
+@callbacks.route(BulkOpen)
+async def admin_bulk_open(callback_query: CallbackQuery, callback_data: BulkOpen, state: FSMContext):
+    if str(callback_query.from_user.id) not in ADMIN_ID:
+        await callback_query.answer("У вас нет прав администратора", show_alert=True)
+        return
+
+    tasks = await get_review_queue(callback_data.order_id, limit=BULK_REVIEW_LIMIT)
+    if not tasks:
+        await callback_query.answer("Нет задач, ожидающих проверки.", show_alert=True)
+        return
+
+    await state.set_state(AdminBulkReviewForm.select)
+    await state.update_data(bulk_tasks=tasks, bulk_selected=[])
+    await render_bulk_review(callback_query.message, state)
+    await callback_query.answer()
+
+@callbacks.route(BulkToggle, AdminBulkReviewForm.select)
+async def admin_bulk_toggle(callback_query: CallbackQuery, callback_data: BulkToggle, state: FSMContext):
+    if str(callback_query.from_user.id) not in ADMIN_ID:
+        await callback_query.answer("У вас нет прав администратора", show_alert=True)
+        return
+
+    task_id = callback_data.task_id
+    data = await state.get_data()
+    selected = data['bulk_selected']
+    if task_id in selected:
+        selected.remove(task_id)
+    else:
+        selected.append(task_id)
+    await state.update_data(bulk_selected=selected)
+    await render_bulk_review(callback_query.message, state)
+    await callback_query.answer()
+
+@callbacks.route(BulkSelect, AdminBulkReviewForm.select)
+async def admin_bulk_select(callback_query: CallbackQuery, callback_data: BulkSelect, state: FSMContext):
+    if str(callback_query.from_user.id) not in ADMIN_ID:
+        await callback_query.answer("У вас нет прав администратора", show_alert=True)
+        return
+
+    data = await state.get_data()
+    selected = [t['id'] for t in data['bulk_tasks']] if callback_data.mode == "all" else []
+    await state.update_data(bulk_selected=selected)
+    await render_bulk_review(callback_query.message, state)
+    await callback_query.answer()
+
+# Меняет статус выбранных задач одним UPDATE и ставит уведомления в очередь одной вставкой
+async def bulk_review(task_ids, status, notification_text):
+    async with in_transaction() as conn:
+        tasks = await Task.filter(id__in=task_ids, status__not=status).using_db(conn).values(
+            'id', 'order_id', 'order__title', 'task_type', 'user_id'
+        )
+        if tasks:
+            await Task.filter(id__in=[t['id'] for t in tasks]).using_db(conn).update(status=status)
+            await review_submissions([t['id'] for t in tasks], status, conn)
+            await refresh_progress({t['order_id'] for t in tasks}, conn)
+            await enqueue_notifications(
+                [(t['user_id'], notification_text(t)) for t in tasks], using_db=conn
+            )
+    outbox.wake()
+    for order_id in {t['order_id'] for t in tasks}:
+        await invalidate_task_board(order_id)
+    return len(tasks)
+
+@callbacks.route(BulkApply, AdminBulkReviewForm.select)
+async def admin_bulk_apply(callback_query: CallbackQuery, callback_data: BulkApply, state: FSMContext):
+    if str(callback_query.from_user.id) not in ADMIN_ID:
+        await callback_query.answer("У вас нет прав администратора", show_alert=True)
+        return
+
+    data = await state.get_data()
+    selected = data['bulk_selected']
+    if not selected:
+        await callback_query.answer("Сначала отметьте хотя бы одну задачу.", show_alert=True)
+        return
+
+    if callback_data.action == "approve":
+        count = await bulk_review(selected, TaskStatus.APPROVED, lambda t: f"✅ Ваша задача '{task_type_label(t['task_type'])}' в проекте '{t['order__title']}' одобрена администратором.")
+        result_text = f"Одобрено задач: {count}."
+    else:
+        count = await bulk_review(selected, TaskStatus.REJECTED, lambda t: f"❌ Ваша задача '{task_type_label(t['task_type'])}' в проекте '{t['order__title']}' была отклонена администратором. Пожалуйста, проверьте предоставленные файлы.")
+        result_text = f"Отклонено задач: {count}."
+
+    await state.clear()
+    return_keyboard = InlineKeyboardMarkup(
+        inline_keyboard=[[InlineKeyboardButton(text="⬅️ Назад к проектам", callback_data=ReviewProjects().pack())]]
+    )
+    await callback_query.message.edit_text(result_text, reply_markup=return_keyboard)
+    await callback_query.answer()
+
 # НОВЫЙ ОБРАБОТЧИК для кнопки "Назад" при загрузке файлов
-@dp.callback_query(lambda c: c.data == "submit_back_to_tasks", SubmitWorkForm.upload_files)
+@callbacks.route(SubmitBack, SubmitWorkForm.upload_files)
 async def submit_back_to_tasks(callback_query: CallbackQuery, state: FSMContext):
     data = await state.get_data()
     project_id = data.get('selected_project')
@@ -597,7 +963,7 @@ async def submit_back_to_tasks(callback_query: CallbackQuery, state: FSMContext)
     
     keyboard = InlineKeyboardMarkup(
         inline_keyboard=[
-            [InlineKeyboardButton(text=t['task_type'], callback_data=f"submit_task_{t['id']}")]
+            [InlineKeyboardButton(text=task_type_label(t['task_type']), callback_data=SubmitTask(task_id=t['id']).pack())]
             for t in user_tasks
         ]
     )
@@ -606,9 +972,19 @@ async def submit_back_to_tasks(callback_query: CallbackQuery, state: FSMContext)
     await state.set_state(SubmitWorkForm.select_task) # Возвращаемся в состояние выбора задачи
     await callback_query.answer() # Закрываем уведомление о нажатии кнопки
 
-async def start_bot():
+async def start_bot(started_at=None):
+    # База инициализируется один раз и закрывается при остановке бота
     await setup()
-    await dp.start_polling(bot)
+    if started_at is not None:
+        print(f"Бот готов принимать апдейты через {time.perf_counter() - started_at:.2f} с после запуска")
+    try:
+        if BOT_MODE == "webhook":
+            from webhook import run_webhook
+            await run_webhook(dp, bot)
+        else:
+            await dp.start_polling(bot)
+    finally:
+        await close()
 
 if __name__ == "__main__":
     import asyncio
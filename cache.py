@@ -0,0 +1,139 @@
+import pickle
+import time
+from collections import OrderedDict
+
+from config import CACHE_BACKEND, CACHE_TTL, CACHE_MAXSIZE, REDIS_URL, PROJECTS_PAGE_SIZE
+from database.models import Order
+from database.queries import get_orders_page, get_task_board
+
+
+# Кэш в памяти процесса: записи живут ttl секунд, при переполнении вытесняются самые давние
+class MemoryCache:
+    def __init__(self, ttl=CACHE_TTL, maxsize=CACHE_MAXSIZE):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key):
+        item = self.items.get(key)
+        if item is None or item[0] < time.monotonic():
+            self.items.pop(key, None)
+            self.misses += 1
+            return None
+        self.items.move_to_end(key)
+        self.hits += 1
+        return item[1]
+
+    async def set(self, key, value):
+        self.items[key] = (time.monotonic() + self.ttl, value)
+        self.items.move_to_end(key)
+        while len(self.items) > self.maxsize:
+            self.items.popitem(last=False)
+
+    async def delete(self, *keys):
+        for key in keys:
+            self.items.pop(key, None)
+
+    def stats(self):
+        return {'backend': 'memory', 'hits': self.hits, 'misses': self.misses, 'size': len(self.items)}
+
+
+# Общий кэш в Redis: инвалидация с одной реплики сразу видна остальным
+class RedisCache:
+    def __init__(self, url=REDIS_URL, ttl=CACHE_TTL, prefix="cache:"):
+        from redis.asyncio import Redis
+        self.redis = Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key):
+        raw = await self.redis.get(self.prefix + key)
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return pickle.loads(raw)
+
+    async def set(self, key, value):
+        await self.redis.set(self.prefix + key, pickle.dumps(value), ex=self.ttl)
+
+    async def delete(self, *keys):
+        if keys:
+            await self.redis.delete(*(self.prefix + key for key in keys))
+
+    def stats(self):
+        return {'backend': 'redis', 'hits': self.hits, 'misses': self.misses}
+
+
+# Заглушка для CACHE_BACKEND=none: всегда промах, всё читается из базы
+class NullCache:
+    def __init__(self):
+        self.misses = 0
+
+    async def get(self, key):
+        self.misses += 1
+        return None
+
+    async def set(self, key, value):
+        pass
+
+    async def delete(self, *keys):
+        pass
+
+    def stats(self):
+        return {'backend': 'none', 'hits': 0, 'misses': self.misses}
+
+
+def create_cache():
+    if CACHE_BACKEND == "redis":
+        return RedisCache()
+    if CACHE_BACKEND == "none":
+        return NullCache()
+    return MemoryCache()
+
+
+cache = create_cache()
+
+
+async def _read_through(key, load):
+    value = await cache.get(key)
+    if value is None:
+        value = await load()
+        if value is not None:
+            await cache.set(key, value)
+    return value
+
+
+# Карточка проекта: id, title, description, created_at
+async def get_order(order_id):
+    return await _read_through(
+        f"order:{order_id}",
+        lambda: Order.filter(id=order_id).first().values('id', 'title', 'description', 'created_at'),
+    )
+
+
+async def get_cached_task_board(order_id):
+    return await _read_through(f"board:{order_id}", lambda: _load_board(order_id))
+
+
+async def _load_board(order_id):
+    return dict(await get_task_board(order_id))
+
+
+# Первая страница списка проектов — самый частый запрос ("📋 Проекты" и "Назад")
+async def get_first_projects_page():
+    return await _read_through("projects:first", lambda: get_orders_page(PROJECTS_PAGE_SIZE))
+
+
+# Новый проект меняет первую страницу списка
+async def invalidate_projects():
+    await cache.delete("projects:first")
+
+
+# Взятие задачи, одобрение и отклонение меняют доску задач проекта
+async def invalidate_task_board(order_id):
+    await cache.delete(f"board:{order_id}")
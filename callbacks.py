@@ -0,0 +1,175 @@
+import inspect
+from datetime import datetime, timedelta, timezone
+from typing import Literal, Optional
+
+from aiogram.filters.callback_data import CallbackData
+from aiogram.types import CallbackQuery
+from aiogram.fsm.context import FSMContext
+
+from metrics import set_handler_name
+
+# Разделитель полей callback_data (как у CallbackData по умолчанию)
+SEPARATOR = ":"
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+# Время создания проекта в курсоре страницы — целые микросекунды от эпохи:
+# в ISO-строке есть двоеточия, а callback_data ограничена 64 байтами
+def to_micros(value):
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+
+def from_micros(value):
+    return EPOCH + timedelta(microseconds=value)
+
+
+# Кнопки без параметров сохраняют прежние строки, поэтому старые клавиатуры в чатах продолжают работать.
+# Кнопки с id получили новый формат <действие>:<поля>; старые строки вида order_5 бот отклоняет как устаревшие.
+class ProjectsPage(CallbackData, prefix="projects"):
+    direction: Literal["next", "prev"]
+    created_at: int
+    order_id: int
+
+
+class OpenOrder(CallbackData, prefix="order"):
+    order_id: int
+
+
+class BackToProjects(CallbackData, prefix="back_to_projects"):
+    pass
+
+
+class NewOrder(CallbackData, prefix="new_order"):
+    pass
+
+
+class TakeTask(CallbackData, prefix="take"):
+    task_type: str
+    order_id: int
+
+
+class AdminTasks(CallbackData, prefix="admin_tasks"):
+    pass
+
+
+class AdminPanel(CallbackData, prefix="admin"):
+    pass
+
+
+class AdminExport(CallbackData, prefix="admin_export"):
+    pass
+
+
+class SubmitProject(CallbackData, prefix="submit_proj"):
+    order_id: int
+
+
+class SubmitTask(CallbackData, prefix="submit_task"):
+    task_id: int
+
+
+class SubmitConfirm(CallbackData, prefix="submit_confirm"):
+    pass
+
+
+class SubmitBack(CallbackData, prefix="submit_back_to_tasks"):
+    pass
+
+
+class ReviewProjects(CallbackData, prefix="admin_completed_tasks_start"):
+    pass
+
+
+class ReviewProject(CallbackData, prefix="review_proj"):
+    order_id: int
+
+
+class TaskFiles(CallbackData, prefix="task_files"):
+    task_id: int
+
+
+class ApproveTask(CallbackData, prefix="approve"):
+    task_id: int
+
+
+class RejectTask(CallbackData, prefix="reject"):
+    task_id: int
+
+
+class TaskHistory(CallbackData, prefix="history"):
+    task_id: int
+
+
+class TaskVersion(CallbackData, prefix="version_files"):
+    task_id: int
+    version: int
+
+
+class RejectSkip(CallbackData, prefix="admin_reject_skip"):
+    pass
+
+
+class RejectBack(CallbackData, prefix="reject_back"):
+    task_id: int
+
+
+class BulkOpen(CallbackData, prefix="bulk_open"):
+    # None — все проекты
+    order_id: Optional[int] = None
+
+
+class BulkToggle(CallbackData, prefix="bulk_toggle"):
+    task_id: int
+
+
+class BulkSelect(CallbackData, prefix="bulk_select"):
+    mode: Literal["all", "none"]
+
+
+class BulkApply(CallbackData, prefix="bulk_apply"):
+    action: Literal["approve", "reject"]
+
+
+# Маршрутизатор нажатий: один обработчик на dp.callback_query и таблица {префикс: маршрут}.
+# Вместо перебора фильтров по очереди — один поиск в словаре по действию до первого разделителя.
+# Обработчик получает callback_data, уже разобранную и проверенную фабрикой, и state — если объявил их.
+class CallbackRouter:
+    def __init__(self):
+        # префикс -> (фабрика, обработчик, допустимые состояния или None, имена нужных аргументов)
+        self.routes = {}
+
+    def route(self, factory, *states):
+        def decorator(handler):
+            prefix = factory.__prefix__
+            if prefix in self.routes:
+                raise ValueError(f"Маршрут {prefix!r} уже занят обработчиком {self.routes[prefix][1].__name__}")
+            params = inspect.signature(handler).parameters
+            allowed = frozenset(s.state for s in states) if states else None
+            wants = tuple(name for name in ('callback_data', 'state') if name in params)
+            self.routes[prefix] = (factory, handler, allowed, wants)
+            return handler
+        return decorator
+
+    async def dispatch_callback(self, callback_query: CallbackQuery, state: FSMContext, raw_state: Optional[str] = None):
+        data = callback_query.data or ""
+        route = self.routes.get(data.split(SEPARATOR, 1)[0])
+        if route is None:
+            await callback_query.answer("Кнопка устарела, откройте меню заново")
+            return
+        factory, handler, allowed, wants = route
+        if allowed is not None and raw_state not in allowed:
+            # Кнопка из завершённого или чужого шага диалога
+            await callback_query.answer("Это действие сейчас недоступно")
+            return
+        try:
+            callback_data = factory.unpack(data)
+        except (TypeError, ValueError):
+            await callback_query.answer("Кнопка устарела, откройте меню заново")
+            return
+
+        set_handler_name(handler.__name__)
+        kwargs = {'callback_data': callback_data, 'state': state}
+        return await handler(callback_query, **{name: kwargs[name] for name in wants})
+
+    def setup(self, dp):
+        dp.callback_query.register(self.dispatch_callback)
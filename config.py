@@ -1,5 +1,6 @@
 from dotenv import load_dotenv
 import os
+import secrets
 
 load_dotenv()
 
@@ -11,5 +12,86 @@ ADMIN_ID = [admin_id.strip() for admin_id in ADMIN_IDS_STR.split(',')]
 
 
 POSTGRES_URI = os.getenv("POSTGRES_URI")
+# Пул соединений asyncpg: при занятом пуле обработчики ждут соединение не дольше DB_POOL_ACQUIRE_TIMEOUT
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_ACQUIRE_TIMEOUT = float(os.getenv("DB_POOL_ACQUIRE_TIMEOUT", "10"))
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+DB_COMMAND_TIMEOUT = float(os.getenv("DB_COMMAND_TIMEOUT", "30"))
+DB_MAX_INACTIVE_CONNECTION_LIFETIME = float(os.getenv("DB_MAX_INACTIVE_CONNECTION_LIFETIME", "300"))
 
-print(BOT_TOKEN, ADMIN_ID)
\ No newline at end of file
+PROJECTS_PAGE_SIZE = int(os.getenv("PROJECTS_PAGE_SIZE", "10"))
+
+# Типы задач в формате "код:ключ:название" через ";". Код хранится в базе и не должен меняться,
+# ключ попадает в callback_data кнопок, название видят пользователи
+TASK_TYPES = os.getenv(
+    "TASK_TYPES",
+    "1:script:Написание сценария;2:voice:Озвучка;3:edit:Монтаж;4:preview:Создание превью;5:upload:Отгрузка видео",
+)
+
+# Лимиты исходящих запросов к Bot API (запросов в секунду)
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "30"))
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))
+
+# Входящие апдейты от одного пользователя: в среднем USER_RATE в секунду, пачкой до USER_BURST.
+# Одинаковые нажатия кнопки в пределах DEDUP_WINDOW секунд отбрасываются (кроме кнопок-переключателей)
+USER_RATE = float(os.getenv("USER_RATE", "2"))
+USER_BURST = int(os.getenv("USER_BURST", "10"))
+DEDUP_WINDOW = float(os.getenv("DEDUP_WINDOW", "1"))
+# Сколько пользователей и нажатий помнит ограничитель; самые давние вытесняются
+THROTTLE_MAXSIZE = int(os.getenv("THROTTLE_MAXSIZE", "10000"))
+
+# Сколько секунд ждать следующее сообщение альбома, прежде чем сохранить альбом целиком
+ALBUM_DEBOUNCE = float(os.getenv("ALBUM_DEBOUNCE", "0.5"))
+
+# Запись обезличенной трассы входящих апдейтов для bench/replay.py; пустое значение — не писать.
+# Соль псевдонимов по умолчанию случайная, и трассы разных запусков нельзя связать между собой
+TRACE_FILE = os.getenv("TRACE_FILE", "")
+TRACE_SALT = os.getenv("TRACE_SALT") or secrets.token_hex(16)
+
+# Хранилище состояний FSM: memory, postgres или redis
+FSM_STORAGE = os.getenv("FSM_STORAGE", "memory")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# Через сколько секунд без активности состояние пользователя истекает
+FSM_TTL = int(os.getenv("FSM_TTL", "86400"))
+
+# Кэш проектов и досок задач: memory, redis (общий для реплик) или none
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_TTL = int(os.getenv("CACHE_TTL", "300"))
+CACHE_MAXSIZE = int(os.getenv("CACHE_MAXSIZE", "10000"))
+
+# Очередь уведомлений: число воркеров и попыток отправки
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", "4"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+
+# Адрес эндпоинта /metrics в формате Prometheus; METRICS_PORT=0 отключает сервер
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9101"))
+
+# Режим получения апдейтов: polling или webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+# Публичный адрес, на который Telegram будет слать апдейты, например https://bot.example.com.
+# Обязателен в режиме webhook, только https
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+# Обязателен в режиме webhook: Telegram присылает его в заголовке, запросы без него отклоняются.
+# Допустимы символы A-Z, a-z, 0-9, _ и -, до 256 символов
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+# Сколько апдейтов обрабатывается одновременно и сколько может ждать в очереди
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "64"))
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", "30"))
+
+# Число процессов-обработчиков. 1 — бот работает в одном процессе, больше 1 — супервизор (supervisor.py)
+# раздаёт апдейты воркерам по id пользователя
+WORKERS = int(os.getenv("WORKERS", "1"))
+# Сколько апдейтов может ждать в очереди одного воркера (столько же — в буфере супервизора и среди
+# принятых воркером) и сколько он обрабатывает одновременно
+WORKER_QUEUE_SIZE = int(os.getenv("WORKER_QUEUE_SIZE", "1000"))
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "64"))
+# Как часто воркер отчитывается супервизору и через сколько секунд без отчёта он перезапускается
+WORKER_HEARTBEAT = float(os.getenv("WORKER_HEARTBEAT", "5"))
+WORKER_STALL_TIMEOUT = float(os.getenv("WORKER_STALL_TIMEOUT", "60"))
+WORKER_DRAIN_TIMEOUT = float(os.getenv("WORKER_DRAIN_TIMEOUT", "30"))
@@ -1,5 +1,11 @@
-from tortoise import Tortoise 
-from config import POSTGRES_URI
+from tortoise import Tortoise
+from tortoise.backends.base.config_generator import expand_db_url
+from config import (
+    POSTGRES_URI, DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_STATEMENT_CACHE_SIZE,
+    DB_COMMAND_TIMEOUT, DB_MAX_INACTIVE_CONNECTION_LIFETIME,
+)
+from database.migrations import migrate
+from database.pool import instrument_pool
 
 TORTOISE_ORM = {
     "connections": {
@@ -13,7 +19,41 @@ TORTOISE_ORM = {
     },
 }
 
+_initialized = False
 
+
+# Настройки пула asyncpg из конфига; параметры в самом POSTGRES_URI имеют приоритет
+def connection_config(uri):
+    config = expand_db_url(uri)
+    if config["engine"] == "tortoise.backends.asyncpg":
+        credentials = config["credentials"]
+        credentials.setdefault("minsize", DB_POOL_MIN_SIZE)
+        credentials.setdefault("maxsize", DB_POOL_MAX_SIZE)
+        credentials.setdefault("statement_cache_size", DB_STATEMENT_CACHE_SIZE)
+        credentials.setdefault("command_timeout", DB_COMMAND_TIMEOUT)
+        credentials.setdefault("max_inactive_connection_lifetime", DB_MAX_INACTIVE_CONNECTION_LIFETIME)
+    return config
+
+
+# Инициализирует базу один раз за процесс; повторные вызовы ничего не делают
 async def setup():
-    await Tortoise.init(config=TORTOISE_ORM)
-    await Tortoise.generate_schemas()
\ No newline at end of file
+    global _initialized
+    if _initialized:
+        return
+    await Tortoise.init(config={**TORTOISE_ORM, "connections": {"default": connection_config(POSTGRES_URI)}})
+    # Создаёт недостающие таблицы и применяет миграции к существующей базе
+    try:
+        await migrate()
+        instrument_pool()
+    except Exception:
+        # Иначе открытое соединение не даст процессу завершиться
+        await Tortoise.close_connections()
+        raise
+    _initialized = True
+
+
+async def close():
+    global _initialized
+    if _initialized:
+        await Tortoise.close_connections()
+        _initialized = False
@@ -0,0 +1,244 @@
+from tortoise import Tortoise
+from tortoise.exceptions import OperationalError
+from tortoise.transactions import in_transaction
+
+from database.progress import rebuild_progress
+from database.registry import TASK_TYPES, LEGACY_STATUSES, TaskStatus
+
+
+def _case(column, mapping, default=None):
+    whens = " ".join(
+        "WHEN '%s' THEN %d" % (value.replace("'", "''"), code) for value, code in mapping.items()
+    )
+    otherwise = f" ELSE {default}" if default is not None else ""
+    return f'CASE "{column}" {whens}{otherwise} END'
+
+
+# Переводит tasks.task_type и tasks.status со строк на коды справочника.
+# Коды типов берутся из TASK_TYPES, поэтому шаг выполняется кодом, а не готовым SQL.
+async def _convert_task_codes(using_db):
+    codes = {t.label: t.code for t in TASK_TYPES}
+    _, rows = await using_db.execute_query('SELECT DISTINCT "task_type" FROM "tasks"')
+    unknown = sorted({row["task_type"] for row in rows} - set(codes))
+    if unknown:
+        raise RuntimeError(
+            f"Типы задач {unknown} отсутствуют в TASK_TYPES — добавьте их в конфиг и перезапустите бота"
+        )
+
+    task_type = _case("task_type", codes)
+    status = _case("status", LEGACY_STATUSES, int(TaskStatus.PENDING))
+    if using_db.capabilities.dialect == "postgres":
+        # Индексы по этим столбцам Postgres перестраивает сам
+        await using_db.execute_script(
+            f'ALTER TABLE "tasks" ALTER COLUMN "task_type" TYPE SMALLINT USING {task_type}, '
+            f'ALTER COLUMN "status" TYPE SMALLINT USING {status}'
+        )
+    else:
+        # SQLite не меняет тип столбца — пересоздаём таблицу. Внешние ключи на время миграций
+        # выключены (см. migrate), а legacy_alter_table не даёт RENAME переписать ссылки
+        # submitted_files на tasks_old: после замены они снова указывают на новую tasks
+        for sql in [
+            'PRAGMA legacy_alter_table = ON',
+            'ALTER TABLE "tasks" RENAME TO "tasks_old"',
+            'DROP INDEX IF EXISTS "idx_tasks_user_status"',
+            'DROP INDEX IF EXISTS "uid_tasks_order_task_type"',
+            '''CREATE TABLE "tasks" (
+                "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+                "user_id" VARCHAR(32) NOT NULL,
+                "task_type" SMALLINT NOT NULL,
+                "created_at" TIMESTAMP NOT NULL,
+                "status" SMALLINT NOT NULL,
+                "order_id" INT NOT NULL REFERENCES "orders" ("id") ON DELETE CASCADE,
+                CONSTRAINT "uid_tasks_order_i_c75504" UNIQUE ("order_id", "task_type")
+            )''',
+            'CREATE INDEX "idx_tasks_user_status" ON "tasks" ("user_id", "status")',
+            f'INSERT INTO "tasks" ("id", "user_id", "task_type", "created_at", "status", "order_id") '
+            f'SELECT "id", "user_id", {task_type}, "created_at", {status}, "order_id" FROM "tasks_old"',
+            'DROP TABLE "tasks_old"',
+            'PRAGMA legacy_alter_table = OFF',
+        ]:
+            await using_db.execute_query(sql)
+
+# Версии сдач: уже сданные файлы каждой задачи становятся её версией 1 со статусом задачи.
+# Уникальный ключ файлов меняется с (task_id, file_id) на (task_id, version, file_id):
+# в исправленную версию можно снова приложить файл из прошлой.
+async def _version_submissions(using_db):
+    if using_db.capabilities.dialect == "postgres":
+        await using_db.execute_script('''
+            ALTER TABLE "submitted_files" ADD COLUMN IF NOT EXISTS "version" SMALLINT NOT NULL DEFAULT 1;
+            ALTER TABLE "submitted_files" ALTER COLUMN "version" DROP DEFAULT;
+            DO $$
+            DECLARE name TEXT;
+            BEGIN
+                -- Ограничение из generate_schemas названо по хэшу, поэтому ищем его по таблице
+                FOR name IN SELECT conname FROM pg_constraint
+                            WHERE conrelid = '"submitted_files"'::regclass AND contype = 'u' LOOP
+                    EXECUTE format('ALTER TABLE "submitted_files" DROP CONSTRAINT %I', name);
+                END LOOP;
+            END $$;
+            DROP INDEX IF EXISTS "uid_submitted_files_task_file";
+            CREATE UNIQUE INDEX IF NOT EXISTS "uid_submitted_files_task_version_file"
+                ON "submitted_files" ("task_id", "version", "file_id");
+        ''')
+    else:
+        # Ограничение UNIQUE внутри CREATE TABLE в SQLite не удалить — пересоздаём таблицу.
+        # На submitted_files никто не ссылается, так что RENAME ничего не переписывает
+        for sql in [
+            'ALTER TABLE "submitted_files" RENAME TO "submitted_files_old"',
+            '''CREATE TABLE "submitted_files" (
+                "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+                "version" SMALLINT NOT NULL,
+                "file_id" VARCHAR(255) NOT NULL,
+                "file_type" VARCHAR(32) NOT NULL,
+                "uploaded_at" TIMESTAMP NOT NULL,
+                "task_id" INT NOT NULL REFERENCES "tasks" ("id") ON DELETE CASCADE,
+                CONSTRAINT "uid_submitted_f_task_id_eefc6c" UNIQUE ("task_id", "version", "file_id")
+            )''',
+            'INSERT INTO "submitted_files" ("id", "version", "file_id", "file_type", "uploaded_at", "task_id") '
+            'SELECT "id", 1, "file_id", "file_type", "uploaded_at", "task_id" FROM "submitted_files_old"',
+            'DROP TABLE "submitted_files_old"',
+        ]:
+            await using_db.execute_query(sql)
+
+    # Причины прошлых отклонений нигде не сохранялись — у версии 1 её нет
+    await using_db.execute_query('''
+        INSERT INTO "submissions" ("task_id", "version", "status", "files", "created_at", "updated_at")
+        SELECT f."task_id", 1, t."status", COUNT(*), MIN(f."uploaded_at"), MAX(f."uploaded_at")
+        FROM "submitted_files" f
+        JOIN "tasks" t ON t."id" = f."task_id"
+        GROUP BY f."task_id", t."status"
+    ''')
+
+# Версионированные миграции для уже существующих баз.
+# Свежая база получает всю схему из generate_schemas и сразу помечается последней версией,
+# поэтому каждая миграция должна повторять то, что объявлено в моделях. Любое изменение
+# моделей (в том числе новая таблица) требует новой миграции: при совпадающей версии
+# generate_schemas на старте пропускается.
+MIGRATIONS = [
+    (1, "Индексы для горячих запросов по задачам и файлам", [
+        # Дубли задач (гонка в take_task) сливаем в задачу того, кто взял её первым: файлы
+        # переносим в неё, а строки удаляемых задач (исполнитель, статус) и прежняя задача
+        # каждого перенесённого файла остаются в архивных таблицах tasks_duplicates и
+        # submitted_files_moved. Их можно удалить, когда дубли разобраны вручную
+        """CREATE TABLE IF NOT EXISTS "submitted_files_moved" AS
+            SELECT f."id" AS "file_record_id", f."task_id" AS "from_task_id" FROM "submitted_files" f
+            WHERE f."task_id" NOT IN (SELECT MIN("id") FROM "tasks" GROUP BY "order_id", "task_type")""",
+        """CREATE TABLE IF NOT EXISTS "tasks_duplicates" AS
+            SELECT t.*, (
+                SELECT MIN(d."id") FROM "tasks" d WHERE d."order_id" = t."order_id" AND d."task_type" = t."task_type"
+            ) AS "kept_task_id"
+            FROM "tasks" t
+            WHERE t."id" NOT IN (SELECT MIN("id") FROM "tasks" GROUP BY "order_id", "task_type")""",
+        """UPDATE submitted_files SET task_id = (
+            SELECT MIN(d.id) FROM tasks t
+            JOIN tasks d ON d.order_id = t.order_id AND d.task_type = t.task_type
+            WHERE t.id = submitted_files.task_id
+        )""",
+        """DELETE FROM tasks WHERE id NOT IN (
+            SELECT MIN(id) FROM tasks GROUP BY order_id, task_type
+        )""",
+        'CREATE UNIQUE INDEX IF NOT EXISTS "uid_tasks_order_task_type" ON "tasks" ("order_id", "task_type")',
+        'CREATE INDEX IF NOT EXISTS "idx_tasks_user_status" ON "tasks" ("user_id", "status")',
+        'CREATE INDEX IF NOT EXISTS "idx_submitted_files_task_file" ON "submitted_files" ("task_id", "file_id")',
+    ]),
+    (2, "Уникальный ключ (task_id, file_id) для сдаваемых файлов", [
+        # Повторно сданный файл (тот же file_id в той же задаче) остаётся одной строкой — самой ранней.
+        # Удаляемые строки сохраняются в submitted_files_duplicates
+        """CREATE TABLE IF NOT EXISTS "submitted_files_duplicates" AS
+            SELECT * FROM "submitted_files"
+            WHERE "id" NOT IN (SELECT MIN("id") FROM "submitted_files" GROUP BY "task_id", "file_id")""",
+        """DELETE FROM submitted_files WHERE id NOT IN (
+            SELECT MIN(id) FROM submitted_files GROUP BY task_id, file_id
+        )""",
+        'DROP INDEX IF EXISTS "idx_submitted_files_task_file"',
+        'CREATE UNIQUE INDEX IF NOT EXISTS "uid_submitted_files_task_file" ON "submitted_files" ("task_id", "file_id")',
+    ]),
+    (3, "Индекс (created_at, id) для постраничного списка проектов", [
+        'CREATE INDEX IF NOT EXISTS "idx_orders_created_id" ON "orders" ("created_at", "id")',
+    ]),
+    # Новые таблицы создаёт generate_schemas на пути обновления, миграция только поднимает версию
+    (4, "Таблицы fsm_states и notifications", []),
+    # Таблицу order_progress создаёт generate_schemas. Заполняется она в миграции 6: модели
+    # читают задачи уже в кодах, а строки старых баз переводятся только там
+    (5, "Сводка прогресса по проектам", []),
+    # Сводка хранит типы и статусы задач, поэтому после перевода на коды пересобирается
+    (6, "Коды типов и статусов задач вместо строк", [_convert_task_codes, rebuild_progress]),
+    # Таблицу submissions создаёт generate_schemas; сводка теперь считает файлы последней версии
+    (7, "Версии сдач и причина отклонения", [_version_submissions, rebuild_progress]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+# Ключ pg_advisory_lock, под которым выполняются миграции
+MIGRATION_LOCK_KEY = 0x7E4A0001
+
+
+async def _table_exists(conn, table):
+    try:
+        await conn.execute_query(f'SELECT 1 FROM "{table}" LIMIT 1')
+    except OperationalError:
+        return False
+    return True
+
+
+async def get_schema_version(conn):
+    if not await _table_exists(conn, "schema_version"):
+        return None
+    _, rows = await conn.execute_query('SELECT MAX("version") AS "version" FROM "schema_version"')
+    return rows[0]["version"] or 0
+
+
+async def migrate():
+    conn = Tortoise.get_connection("default")
+    # Схема уже актуальна — generate_schemas не нужен, старт обходится одним запросом
+    if await get_schema_version(conn) == LATEST_VERSION:
+        return
+    if conn.capabilities.dialect != "postgres":
+        await _migrate(conn)
+        return
+    # Реплики и воркеры стартуют одновременно: миграции выполняет одна, остальные ждут блокировку
+    # и затем видят актуальную версию. Блокировка сессионная, поэтому держится на отдельном соединении
+    async with conn.acquire_connection() as lock_connection:
+        await lock_connection.execute('SELECT pg_advisory_lock($1)', MIGRATION_LOCK_KEY)
+        try:
+            await _migrate(conn)
+        finally:
+            await lock_connection.execute('SELECT pg_advisory_unlock($1)', MIGRATION_LOCK_KEY)
+
+
+async def _migrate(conn):
+    version = await get_schema_version(conn)
+    if version == LATEST_VERSION:
+        return
+    # Таблиц ещё нет — это новая база, миграции ей не нужны
+    fresh = version is None and not await _table_exists(conn, "tasks")
+
+    await Tortoise.generate_schemas(safe=True)
+    await conn.execute_script('CREATE TABLE IF NOT EXISTS "schema_version" ("version" INT NOT NULL)')
+
+    if fresh:
+        await conn.execute_query('INSERT INTO "schema_version" ("version") VALUES (%d)' % LATEST_VERSION)
+        return
+
+    version = version or 0
+    # SQLite пересоздаёт таблицы только с выключенными внешними ключами, а внутри транзакции
+    # PRAGMA не действует — выключаем их на время миграций
+    sqlite = conn.capabilities.dialect == "sqlite"
+    if sqlite:
+        await conn.execute_query('PRAGMA foreign_keys = OFF')
+    try:
+        for number, description, statements in MIGRATIONS:
+            if number <= version:
+                continue
+            print(f"Применяю миграцию {number}: {description}")
+            async with in_transaction() as tx:
+                for step in statements:
+                    # Шаг миграции — SQL-скрипт или функция, которой нужна транзакция
+                    if callable(step):
+                        await step(using_db=tx)
+                    else:
+                        await tx.execute_script(step)
+                await tx.execute_query('INSERT INTO "schema_version" ("version") VALUES (%d)' % number)
+    finally:
+        if sqlite:
+            await conn.execute_query('PRAGMA foreign_keys = ON')
@@ -1,5 +1,7 @@
 from tortoise.models import Model
 from tortoise import fields
+from tortoise.indexes import Index
+from database.registry import TaskStatus, task_type_label
 
 class Order(Model):
     id = fields.IntField(pk=True)
@@ -9,6 +11,8 @@ class Order(Model):
     
     class Meta:
         table = "orders"
+        # Постраничный список проектов идёт по ключу (created_at, id)
+        indexes = (Index(fields=("created_at", "id"), name="idx_orders_created_id"),)
 
     def __str__(self):
         return self.title
@@ -17,26 +21,99 @@ class Task(Model):
     id = fields.IntField(pk=True)
     order = fields.ForeignKeyField('models.Order', related_name='tasks')
     user_id = fields.CharField(max_length=32)  # Telegram user id
-    task_type = fields.CharField(max_length=32)  # Например: сценарий, озвучка и т.д.
+    task_type = fields.SmallIntField()  # Код из справочника database.registry.TASK_TYPES
     created_at = fields.DatetimeField(auto_now_add=True)
     # Добавляем поле статуса для отслеживания одобрения администратором
-    status = fields.CharField(max_length=50, default='pending') # 'pending', 'approved', 'rejected'
+    status = fields.IntEnumField(TaskStatus, default=TaskStatus.PENDING)
 
     class Meta:
         table = "tasks"
+        # Один исполнитель на каждый тип задачи в заказе
+        unique_together = (("order", "task_type"),)
+        # "Мои задачи" и "Сдать работу" фильтруют по исполнителю и статусу
+        indexes = (Index(fields=("user_id", "status"), name="idx_tasks_user_status"),)
 
     def __str__(self):
-        return f"{self.task_type} для {self.order.title} ({self.user_id})"
+        return f"{task_type_label(self.task_type)} для {self.order.title} ({self.user_id})"
+
+# Сдача задачи на проверку. Каждая сдача после проверки получает следующий номер версии,
+# файлы до проверки дописываются в текущую. Причина отклонения хранится в версии
+class Submission(Model):
+    id = fields.IntField(pk=True)
+    task = fields.ForeignKeyField('models.Task', related_name='submissions')
+    version = fields.SmallIntField()  # 1, 2, ... по порядку сдачи
+    status = fields.IntEnumField(TaskStatus, default=TaskStatus.PENDING)
+    reject_reason = fields.TextField(null=True)
+    files = fields.IntField(default=0)  # Сколько файлов в этой версии
+    created_at = fields.DatetimeField(auto_now_add=True)
+    updated_at = fields.DatetimeField()  # Когда в версию добавлен последний файл
+    reviewed_at = fields.DatetimeField(null=True)
+
+    class Meta:
+        table = "submissions"
+        # Последняя версия задачи и переход к предыдущим — по ключу (task_id, version)
+        unique_together = (("task", "version"),)
+
+    def __str__(self):
+        return f"Версия {self.version} задачи {self.task_id}"
 
 class SubmittedFile(Model):
     id = fields.IntField(pk=True)
     task = fields.ForeignKeyField('models.Task', related_name='submitted_files')
+    version = fields.SmallIntField(default=1)  # Номер сдачи (Submission.version)
     file_id = fields.CharField(max_length=255)
     file_type = fields.CharField(max_length=32) # 'document', 'photo', 'video'
     uploaded_at = fields.DatetimeField(auto_now_add=True)
 
     class Meta:
         table = "submitted_files"
+        # Файл входит в версию один раз; ключ (task_id, version, ...) отдаёт файлы одной версии
+        unique_together = (("task", "version", "file_id"),)
 
     def __str__(self):
         return f"{self.file_type} для задачи {self.task_id}"
+
+
+# Состояния FSM для DatabaseStorage: переживают перезапуск и общие для всех реплик
+class FsmRecord(Model):
+    key = fields.CharField(max_length=255, pk=True)
+    state = fields.CharField(max_length=255, null=True)
+    data = fields.JSONField(default=dict)
+    expires_at = fields.DatetimeField(index=True)
+
+    class Meta:
+        table = "fsm_states"
+
+
+# Исходящие уведомления: строка пишется в одной транзакции с изменением задачи,
+# а отправляют её фоновые воркеры outbox.Outbox
+class Notification(Model):
+    id = fields.IntField(pk=True)
+    user_id = fields.CharField(max_length=32)  # Telegram user id получателя
+    text = fields.TextField()
+    status = fields.CharField(max_length=16, default='pending')  # 'pending', 'sent', 'failed'
+    attempts = fields.IntField(default=0)
+    next_attempt_at = fields.DatetimeField()
+    last_error = fields.TextField(null=True)
+    created_at = fields.DatetimeField(auto_now_add=True)
+    sent_at = fields.DatetimeField(null=True)
+
+    class Meta:
+        table = "notifications"
+        # Воркеры выбирают ожидающие уведомления, срок которых подошёл
+        indexes = (Index(fields=("status", "next_attempt_at"), name="idx_notifications_due"),)
+
+
+# Сводка прогресса по проекту для экранов проверки: одна строка на заказ,
+# обновляется в тех же транзакциях, что меняют задачи и файлы (database.progress)
+class OrderProgress(Model):
+    order = fields.OneToOneField('models.Order', related_name='progress', pk=True)
+    title = fields.CharField(max_length=255)
+    # {код типа задачи: {'id', 'user_id', 'status', 'version', 'files', 'last_upload'}} в порядке взятия задач;
+    # files и last_upload — по последней версии сдачи
+    tasks = fields.JSONField(default=dict)
+    files = fields.IntField(default=0)  # Файлов в последних версиях всех задач проекта
+    last_upload_at = fields.DatetimeField(null=True)
+
+    class Meta:
+        table = "order_progress"
@@ -0,0 +1,84 @@
+import asyncio
+import time
+
+from tortoise import Tortoise
+from tortoise.exceptions import ConfigurationError
+
+from config import DB_POOL_ACQUIRE_TIMEOUT
+
+# Наблюдатели за временем ожидания соединения (например, гистограмма в metrics.py)
+wait_observers = []
+
+stats = {
+    'acquired': 0,
+    'wait_seconds_total': 0.0,
+    'wait_seconds_max': 0.0,
+    'timeouts': 0,
+}
+
+
+def _client():
+    try:
+        return Tortoise.get_connection("default")
+    except ConfigurationError:
+        return None
+
+
+def _pool():
+    # База ещё не инициализирована или уже закрыта, а /metrics всё равно опрашивают
+    pool = getattr(_client(), "_pool", None)
+    return pool.pool if isinstance(pool, TimedPool) else pool
+
+
+# Пул asyncpg глазами Tortoise: выдача соединений считает время ожидания и ограничивает его
+# DB_POOL_ACQUIRE_TIMEOUT, чтобы при всплеске обработчики ждали в очереди ограниченное время,
+# а не висели бесконечно. Остальное передаётся пулу как есть.
+class TimedPool:
+    def __init__(self, pool):
+        self.pool = pool
+
+    async def acquire(self, *, timeout=None):
+        started = time.perf_counter()
+        try:
+            return await self.pool.acquire(timeout=timeout if timeout is not None else DB_POOL_ACQUIRE_TIMEOUT)
+        except asyncio.TimeoutError:
+            stats['timeouts'] += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            stats['acquired'] += 1
+            stats['wait_seconds_total'] += waited
+            stats['wait_seconds_max'] = max(stats['wait_seconds_max'], waited)
+            for observe in wait_observers:
+                observe(waited)
+
+    def __getattr__(self, name):
+        return getattr(self.pool, name)
+
+
+# Tortoise берёт соединения через client._pool.acquire() (и в запросах, и в транзакциях),
+# поэтому обёртка ставится на ссылку клиента. Сам Pool asyncpg объявлен со __slots__,
+# и подменить его методы нельзя.
+def instrument_pool():
+    client = _client()
+    pool = getattr(client, "_pool", None)
+    if pool is None or isinstance(pool, TimedPool):
+        return
+    client._pool = TimedPool(pool)
+
+
+# Текущее состояние пула: размер, свободные соединения и заполненность (0..1)
+def pool_stats():
+    result = dict(stats)
+    pool = _pool()
+    if pool is not None:
+        size = pool.get_size()
+        idle = pool.get_idle_size()
+        result.update({
+            'size': size,
+            'idle': idle,
+            'in_use': size - idle,
+            'max_size': pool.get_max_size(),
+            'saturation': (size - idle) / pool.get_max_size(),
+        })
+    return result
@@ -0,0 +1,100 @@
+from tortoise.transactions import in_transaction
+
+from database.models import Order, Task, Submission, OrderProgress
+
+
+# Пересчитывает сводку прогресса заказов. Вызывать внутри транзакции, которая меняет
+# задачи или файлы этих заказов: строки заказов блокируются (по порядку id, без взаимных
+# блокировок), поэтому параллельные изменения одного проекта не затрут сводку друг друга.
+# На заказ приходится не больше пяти задач, а версий у задачи единицы, так что пересчёт —
+# два коротких запроса без чтения самих файлов. Файлы и время загрузки — по последней версии.
+async def refresh_progress(order_ids, using_db):
+    order_ids = sorted(set(order_ids))
+    if not order_ids:
+        return
+    orders = await Order.filter(id__in=order_ids).select_for_update().order_by('id').using_db(using_db).values('id', 'title')
+    rows = await Task.filter(order_id__in=order_ids).order_by('id').using_db(using_db).values(
+        'id', 'order_id', 'task_type', 'user_id', 'status'
+    )
+    submissions = await Submission.filter(task__order_id__in=order_ids).order_by('task_id', 'version').using_db(using_db).values(
+        'task_id', 'version', 'files', 'updated_at'
+    )
+    # Версии идут по возрастанию — последняя перезаписывает предыдущие
+    latest = {submission['task_id']: submission for submission in submissions}
+
+    progress = {
+        order['id']: OrderProgress(order_id=order['id'], title=order['title'], tasks={}, files=0)
+        for order in orders
+    }
+    for row in rows:
+        item = progress[row['order_id']]
+        submission = latest.get(row['id'])
+        files = submission['files'] if submission else 0
+        last_upload = submission['updated_at'] if submission else None
+        # Ключи JSON — строки, поэтому код типа сразу приводим к строке
+        item.tasks.setdefault(str(row['task_type']), {
+            'id': row['id'],
+            'user_id': row['user_id'],
+            'status': int(row['status']),
+            'version': submission['version'] if submission else 0,
+            'files': files,
+            'last_upload': last_upload.isoformat() if last_upload else None,
+        })
+        item.files += files
+        if last_upload and (item.last_upload_at is None or last_upload > item.last_upload_at):
+            item.last_upload_at = last_upload
+
+    if progress:
+        await OrderProgress.bulk_create(
+            list(progress.values()),
+            on_conflict=['order_id'],
+            update_fields=['title', 'tasks', 'files', 'last_upload_at'],
+            using_db=using_db,
+        )
+
+
+# Пересобирает сводку для всех заказов пачками по id — для существующих данных
+# и на случай ручных правок в базе. Возвращает число заказов.
+async def rebuild_progress(batch_size=500, using_db=None):
+    total = 0
+    last = 0
+    while True:
+        if using_db is None:
+            async with in_transaction() as conn:
+                order_ids = await _next_order_ids(last, batch_size, conn)
+                await refresh_progress(order_ids, conn)
+        else:
+            order_ids = await _next_order_ids(last, batch_size, using_db)
+            await refresh_progress(order_ids, using_db)
+        if not order_ids:
+            return total
+        total += len(order_ids)
+        last = order_ids[-1]
+
+
+async def _next_order_ids(last, batch_size, using_db):
+    return await Order.filter(id__gt=last).order_by('id').limit(batch_size).using_db(using_db).values_list('id', flat=True)
+
+
+# Проекты со сданными файлами для экрана "Выполненные задачи": [{'order_id', 'title'}]
+async def get_projects_with_files():
+    return await OrderProgress.filter(files__gt=0).order_by('order_id').values('order_id', 'title')
+
+
+async def get_progress(order_id):
+    return await OrderProgress.get_or_none(order_id=order_id)
+
+
+if __name__ == "__main__":
+    import asyncio
+
+    import database
+
+    async def main():
+        await database.setup()
+        try:
+            print(f"Сводка пересобрана для {await rebuild_progress()} проектов")
+        finally:
+            await database.close()
+
+    asyncio.run(main())
@@ -0,0 +1,226 @@
+from collections import defaultdict
+
+from tortoise import Tortoise, timezone
+from tortoise.exceptions import IntegrityError
+from tortoise.expressions import Q
+from tortoise.transactions import in_transaction
+
+from database.models import Order, Task, Submission, SubmittedFile
+from database.progress import refresh_progress
+from database.registry import TaskStatus
+
+
+# Страница проектов по ключу (created_at, id), новые сверху: стоимость не зависит от номера страницы.
+# cursor — (created_at, id) крайнего проекта соседней страницы, backward — листаем назад, к более новым.
+# Возвращает (rows, has_more), где has_more — есть ли ещё проекты в направлении листания.
+async def get_orders_page(limit, cursor=None, backward=False):
+    query = Order.all()
+    if cursor:
+        created_at, order_id = cursor
+        if backward:
+            query = query.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=order_id))
+        else:
+            query = query.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=order_id))
+    if backward:
+        query = query.order_by('created_at', 'id')
+    else:
+        query = query.order_by('-created_at', '-id')
+
+    rows = await query.limit(limit + 1).values('id', 'title', 'created_at')
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if backward:
+        rows.reverse()
+    return rows, has_more
+
+
+# Занятость задач по заказам одним запросом:
+# {order_id: {код типа задачи: {'id': ..., 'user_id': ..., 'status': ...}}}
+async def get_task_boards(order_ids):
+    order_ids = list(order_ids)
+    boards = defaultdict(dict)
+    if not order_ids:
+        return boards
+
+    rows = await Task.filter(order_id__in=order_ids).order_by('id').values(
+        'id', 'order_id', 'task_type', 'user_id', 'status'
+    )
+    for row in rows:
+        # При дублях считаем владельцем того, кто взял задачу первым
+        boards[row['order_id']].setdefault(row['task_type'], {
+            'id': row['id'],
+            'user_id': row['user_id'],
+            'status': row['status'],
+        })
+    return boards
+
+
+async def get_task_board(order_id):
+    boards = await get_task_boards([order_id])
+    return boards[order_id]
+
+
+# Потоково отдаёт задачи пачками, упорядоченными по (order_id, id), чтобы задачи
+# одного проекта шли подряд. Каждая пачка — отдельный запрос по ключу, память не растёт.
+async def iter_task_rows(batch_size=500, **filters):
+    last = None
+    while True:
+        query = Task.filter(**filters)
+        if last:
+            query = query.filter(Q(order_id__gt=last[0]) | Q(order_id=last[0], id__gt=last[1]))
+        rows = await query.order_by('order_id', 'id').limit(batch_size).values(
+            'id', 'order_id', 'order__title', 'task_type', 'user_id', 'status'
+        )
+        if not rows:
+            return
+        yield rows
+        if len(rows) < batch_size:
+            return
+        last = (rows[-1]['order_id'], rows[-1]['id'])
+
+
+# Задачи с непроверенной версией сдачи — очередь на проверку.
+# order_id=None — по всем проектам сразу.
+async def get_review_queue(order_id=None, limit=50):
+    # Непроверенной может быть только последняя версия, так что дублей задач нет
+    query = Task.filter(submissions__status=TaskStatus.PENDING)
+    if order_id is not None:
+        query = query.filter(order_id=order_id)
+    return await query.order_by('order_id', 'id').limit(limit).values(
+        'id', 'order_id', 'order__title', 'task_type', 'user_id'
+    )
+
+
+# Атомарно берёт задачу: одна вставка под уникальным ключом (order, task_type).
+# Возвращает (task, None) при успехе, (None, user_id текущего исполнителя), если задача занята,
+# и (None, None), если проекта нет.
+async def claim_task(order_id, task_type, user_id):
+    try:
+        async with in_transaction() as conn:
+            task = await Task.create(order_id=order_id, user_id=user_id, task_type=task_type, using_db=conn)
+            await refresh_progress([order_id], conn)
+    except IntegrityError:
+        # Вставку отклоняет и занятый ключ (order, task_type), и внешний ключ удалённого проекта
+        owner = await Task.filter(order_id=order_id, task_type=task_type).values_list('user_id', flat=True)
+        if owner:
+            return None, owner[0]
+        if await Order.exists(id=order_id):
+            # Ни исполнителя, ни пропавшего проекта — это не занятость, не выдаём её за неё
+            raise
+        return None, None
+    return task, None
+
+
+# Сохраняет файлы задачи в её текущую версию одной проверкой существования и одной пакетной вставкой,
+# в той же транзакции обновляет сводку проекта. Пока версия не проверена, файлы дописываются в неё;
+# после одобрения или отклонения сдача открывает следующую версию и возвращает задачу на проверку.
+# Возвращает (количество новых файлов, номер версии).
+async def save_submitted_files(task_id, files):
+    async with in_transaction() as conn:
+        # Блокировка задачи упорядочивает параллельные сдачи: номер версии выдаётся один раз
+        order_ids = await Task.filter(id=task_id).select_for_update().using_db(conn).values_list('order_id', flat=True)
+        submission = await Submission.filter(task_id=task_id).order_by('-version').using_db(conn).first()
+        now = timezone.now()
+        if submission is None or submission.status != TaskStatus.PENDING:
+            submission = await Submission.create(
+                task_id=task_id, version=submission.version + 1 if submission else 1, updated_at=now, using_db=conn
+            )
+            await Task.filter(id=task_id).using_db(conn).update(status=TaskStatus.PENDING)
+
+        existing = set(await SubmittedFile.filter(
+            task_id=task_id, version=submission.version, file_id__in={f['file_id'] for f in files}
+        ).using_db(conn).values_list('file_id', flat=True))
+
+        new_files = []
+        for file_info in files:
+            if file_info['file_id'] in existing:
+                continue
+            existing.add(file_info['file_id'])
+            new_files.append(SubmittedFile(
+                task_id=task_id, version=submission.version, file_id=file_info['file_id'], file_type=file_info['type']
+            ))
+
+        if new_files:
+            # ON CONFLICT DO NOTHING страхует от параллельной сдачи тех же файлов
+            await SubmittedFile.bulk_create(new_files, ignore_conflicts=True, using_db=conn)
+            submission.files += len(new_files)
+            submission.updated_at = now
+            await submission.save(using_db=conn, update_fields=['files', 'updated_at'])
+        await refresh_progress(order_ids, conn)
+    return len(new_files), submission.version
+
+
+# Проставляет итог проверки непроверенным версиям задач в транзакции проверки
+async def review_submissions(task_ids, status, using_db, reason=None):
+    await Submission.filter(task_id__in=task_ids, status=TaskStatus.PENDING).using_db(using_db).update(
+        status=status, reject_reason=reason, reviewed_at=timezone.now()
+    )
+
+
+# Последняя версия сдачи задачи (или указанная) — один поиск по ключу (task_id, version)
+async def get_submission(task_id, version=None):
+    if version is not None:
+        return await Submission.get_or_none(task_id=task_id, version=version)
+    return await Submission.filter(task_id=task_id).order_by('-version').first()
+
+
+# Файлы одной версии: (тип, file_id) в порядке загрузки
+async def get_version_files(task_id, version):
+    return await SubmittedFile.filter(task_id=task_id, version=version).order_by('id').values_list('file_type', 'file_id')
+
+
+# История сдач задачи без файлов — они догружаются по версии отдельно
+async def get_submissions(task_id):
+    return await Submission.filter(task_id=task_id).order_by('version').values(
+        'version', 'status', 'reject_reason', 'files', 'created_at', 'reviewed_at'
+    )
+
+
+# Проекты, задачи и файлы всех версий одной плоской выборкой: строка на файл, задачи без файлов
+# и проекты без задач тоже попадают (с пустыми полями)
+EXPORT_COLUMNS = [
+    'order_id', 'order_title', 'order_created_at', 'task_id', 'task_type', 'user_id', 'status',
+    'task_created_at', 'file_record_id', 'file_type', 'file_id', 'uploaded_at',
+    'version', 'version_status', 'reject_reason',
+]
+EXPORT_SQL = '''
+    SELECT o."id", o."title", o."created_at", t."id", t."task_type", t."user_id", t."status",
+           t."created_at", f."id", f."file_type", f."file_id", f."uploaded_at",
+           f."version", s."status", s."reject_reason"
+    FROM "orders" o
+    LEFT JOIN "tasks" t ON t."order_id" = o."id"
+    LEFT JOIN "submitted_files" f ON f."task_id" = t."id"
+    LEFT JOIN "submissions" s ON s."task_id" = f."task_id" AND s."version" = f."version"
+    {where}
+    ORDER BY o."id", t."id", f."id"
+'''
+
+
+# Потоково отдаёт строки выгрузки пачками (списками кортежей в порядке EXPORT_COLUMNS).
+# В Postgres — серверный курсор внутри транзакции: один запрос, в памяти одна пачка.
+# В остальных базах — пачки по диапазону id проектов, каждая отдельным запросом.
+async def iter_export_rows(batch_size=1000):
+    async with in_transaction() as conn:
+        if conn.capabilities.dialect == "postgres":
+            async with conn.acquire_connection() as connection:
+                batch = []
+                async for record in connection.cursor(EXPORT_SQL.format(where=''), prefetch=batch_size):
+                    batch.append(tuple(record))
+                    if len(batch) == batch_size:
+                        yield batch
+                        batch = []
+                if batch:
+                    yield batch
+            return
+
+    last = 0
+    while True:
+        # Размер пачки — строки batch_size проектов: не больше пяти задач на проект плюс их файлы
+        order_ids = await Order.filter(id__gt=last).order_by('id').limit(batch_size).values_list('id', flat=True)
+        if not order_ids:
+            return
+        _, rows = await Tortoise.get_connection("default").execute_query(
+            EXPORT_SQL.format(where='WHERE o."id" BETWEEN ? AND ?'), [order_ids[0], order_ids[-1]]
+        )
+        yield [tuple(row) for row in rows]
+        last = order_ids[-1]
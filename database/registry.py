@@ -0,0 +1,73 @@
+import re
+from collections import namedtuple
+from enum import IntEnum
+
+from config import TASK_TYPES as TASK_TYPES_SPEC
+
+
+# Статусы задач хранятся в tasks.status небольшими числами
+class TaskStatus(IntEnum):
+    PENDING = 0
+    APPROVED = 1
+    REJECTED = 2
+
+
+STATUS_LABELS = {
+    TaskStatus.PENDING: 'Ожидает одобрения ⏳',
+    TaskStatus.APPROVED: 'Одобрено ✅',
+    TaskStatus.REJECTED: 'Отклонено ❌',
+}
+
+# Строковые статусы, которые хранились в базе до перехода на коды
+LEGACY_STATUSES = {
+    'pending': TaskStatus.PENDING,
+    'approved': TaskStatus.APPROVED,
+    'rejected': TaskStatus.REJECTED,
+}
+
+TaskType = namedtuple("TaskType", ["code", "key", "label"])
+
+
+# Ключ попадает в callback_data: без разделителя ":" и коротким, чтобы уложиться в 64 байта Telegram
+TASK_KEY_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,32}")
+
+
+# Ошибки в TASK_TYPES ловятся при старте: иначе дубль молча перетирает тип,
+# а недопустимый ключ роняет отрисовку карточки проекта
+def parse_task_types(spec):
+    task_types = []
+    codes = set()
+    keys = set()
+    for item in spec.split(";"):
+        if not item.strip():
+            continue
+        parts = [part.strip() for part in item.split(":", 2)]
+        if len(parts) != 3 or not parts[0].isdigit() or not parts[2]:
+            raise RuntimeError(f"TASK_TYPES: ожидается \"код:ключ:название\" с числовым кодом, а задано {item.strip()!r}")
+        code, key, label = int(parts[0]), parts[1], parts[2]
+        if not TASK_KEY_PATTERN.fullmatch(key):
+            raise RuntimeError(
+                f"TASK_TYPES: ключ {key!r} недопустим — только латиница, цифры, _ и -, до 32 символов"
+            )
+        if code in codes:
+            raise RuntimeError(f"TASK_TYPES: код {code} указан дважды")
+        if key in keys:
+            raise RuntimeError(f"TASK_TYPES: ключ {key!r} указан дважды")
+        codes.add(code)
+        keys.add(key)
+        task_types.append(TaskType(code, key, label))
+    if not task_types:
+        raise RuntimeError("TASK_TYPES пуст — укажите хотя бы один тип задачи")
+    return task_types
+
+
+# Справочник типов задач в порядке кнопок на карточке проекта
+TASK_TYPES = parse_task_types(TASK_TYPES_SPEC)
+TASK_TYPES_BY_CODE = {t.code: t for t in TASK_TYPES}
+TASK_TYPES_BY_KEY = {t.key: t for t in TASK_TYPES}
+
+
+def task_type_label(code):
+    task_type = TASK_TYPES_BY_CODE.get(code)
+    # Тип убрали из конфига, а задачи остались — показываем код
+    return task_type.label if task_type else f"Тип {code}"
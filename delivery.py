@@ -0,0 +1,119 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter
+from aiogram.types import FSInputFile, InputMediaDocument, InputMediaPhoto, InputMediaVideo
+
+# Telegram принимает в одной медиа-группе от 2 до 10 элементов
+MEDIA_GROUP_LIMIT = 10
+
+MEDIA_TYPES = {
+    'photo': InputMediaPhoto,
+    'video': InputMediaVideo,
+    'document': InputMediaDocument,
+}
+
+
+# Корзина токенов: не больше rate запросов в секунду, допускается всплеск до burst
+class RateLimiter:
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+# Делит файлы на отправки: фото и видео — медиа-группами, документы — отдельными группами,
+# каждая не больше MEDIA_GROUP_LIMIT. Порядок файлов внутри каждого вида сохраняется.
+def build_media_batches(files):
+    visual = [(file_type, file_id) for file_type, file_id in files if file_type in ('photo', 'video')]
+    documents = [(file_type, file_id) for file_type, file_id in files if file_type == 'document']
+    batches = []
+    for items in (visual, documents):
+        for start in range(0, len(items), MEDIA_GROUP_LIMIT):
+            batches.append(items[start:start + MEDIA_GROUP_LIMIT])
+    return batches
+
+
+class Delivery:
+    def __init__(self, bot, global_rate=30, chat_rate=1, chat_burst=5, max_retries=5, max_chats=10000):
+        self.bot = bot
+        self.global_limiter = RateLimiter(global_rate, burst=global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.max_chats = max_chats
+        # Лимитеры и блокировки по чатам, самые давние вытесняются
+        self.chats = OrderedDict()
+
+    def _chat(self, chat_id):
+        chat = self.chats.pop(chat_id, None)
+        if chat is None:
+            chat = (RateLimiter(self.chat_rate, burst=self.chat_burst), asyncio.Lock())
+            while len(self.chats) >= self.max_chats:
+                self.chats.popitem(last=False)
+        self.chats[chat_id] = chat
+        return chat
+
+    # Выполняет запрос к Bot API с учётом лимитов; на 429 ждёт retry_after от сервера
+    async def call(self, chat_id, make_request):
+        limiter, _ = self._chat(chat_id)
+        for attempt in range(self.max_retries + 1):
+            await limiter.acquire()
+            await self.global_limiter.acquire()
+            try:
+                return await make_request()
+            except TelegramRetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                await asyncio.sleep(e.retry_after)
+            except TelegramNetworkError:
+                if attempt == self.max_retries:
+                    raise
+                await asyncio.sleep(2 ** attempt)
+
+    async def send_message(self, chat_id, text, **kwargs):
+        return await self.call(chat_id, lambda: self.bot.send_message(chat_id, text, **kwargs))
+
+    # Загружает локальный файл документом; при повторе файл читается с диска заново
+    async def send_document(self, chat_id, path, filename=None, **kwargs):
+        return await self.call(
+            chat_id, lambda: self.bot.send_document(chat_id, FSInputFile(path, filename=filename), **kwargs)
+        )
+
+    # Отправляет файлы пачками. Пачки одного чата идут строго по очереди, чтобы порядок
+    # был детерминированным; разные чаты отправляются параллельно.
+    async def send_files(self, chat_id, files, caption=None, parse_mode=None):
+        _, chat_lock = self._chat(chat_id)
+        async with chat_lock:
+            for index, batch in enumerate(build_media_batches(files)):
+                batch_caption = caption if index == 0 else None
+                await self._send_batch(chat_id, batch, batch_caption, parse_mode)
+
+    async def _send_batch(self, chat_id, batch, caption, parse_mode):
+        if len(batch) == 1:
+            file_type, file_id = batch[0]
+            send = getattr(self.bot, f"send_{file_type}")
+            return await self.call(chat_id, lambda: send(chat_id, file_id, caption=caption, parse_mode=parse_mode))
+
+        media = []
+        for index, (file_type, file_id) in enumerate(batch):
+            # Подпись группы — это подпись её первого элемента
+            if index == 0 and caption:
+                media.append(MEDIA_TYPES[file_type](media=file_id, caption=caption, parse_mode=parse_mode))
+            else:
+                media.append(MEDIA_TYPES[file_type](media=file_id))
+        return await self.call(chat_id, lambda: self.bot.send_media_group(chat_id, media))
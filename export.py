@@ -0,0 +1,46 @@
+import asyncio
+import csv
+import gzip
+import os
+import tempfile
+from datetime import datetime
+
+from database.queries import EXPORT_COLUMNS, iter_export_rows
+from database.registry import TaskStatus, task_type_label
+
+
+def _format_row(row):
+    row = list(row)
+    if row[4] is not None:
+        row[4] = task_type_label(row[4])
+    if row[6] is not None:
+        row[6] = TaskStatus(row[6]).name.lower()
+    if row[13] is not None:
+        row[13] = TaskStatus(row[13]).name.lower()
+    return [value.isoformat() if isinstance(value, datetime) else value for value in row]
+
+
+# Пишет выгрузку в CSV, сжатый gzip на лету. Строки приходят из базы пачками, сжатие
+# выполняется в отдельном потоке, чтобы не задерживать остальные апдейты.
+# Возвращает число строк без заголовка.
+async def write_export(path, batch_size=1000):
+    count = 0
+    with gzip.open(path, 'wt', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(EXPORT_COLUMNS)
+        async for batch in iter_export_rows(batch_size):
+            await asyncio.to_thread(writer.writerows, [_format_row(row) for row in batch])
+            count += len(batch)
+    return count
+
+
+# Выгрузка во временный файл; вызывающий удаляет его после отправки
+async def export_to_tempfile():
+    fd, path = tempfile.mkstemp(prefix="teamreel-export-", suffix=".csv.gz")
+    os.close(fd)
+    try:
+        count = await write_export(path)
+    except Exception:
+        os.remove(path)
+        raise
+    return path, count
@@ -1,11 +1,21 @@
+import time
+
+# Время запуска процесса — от него считается готовность к первому апдейту
+STARTED_AT = time.perf_counter()
+
 import asyncio
-import database
+from config import WORKERS
 from bot import start_bot
 
 
 async def main():
-    await database.setup()
-    await start_bot()
+    if WORKERS > 1:
+        # Несколько процессов: апдейты раздаёт супервизор, миграции он же выполняет до запуска воркеров
+        from supervisor import run_supervisor
+        await run_supervisor(STARTED_AT)
+        return
+    # Инициализация базы происходит внутри start_bot
+    await start_bot(STARTED_AT)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,187 @@
+import time
+from contextvars import ContextVar
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiohttp import web
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from tortoise import Tortoise
+
+from config import METRICS_HOST, METRICS_PORT
+from database.pool import pool_stats, wait_observers
+
+HANDLER_LATENCY = Histogram(
+    "bot_handler_duration_seconds", "Время работы обработчика", ["handler"],
+)
+HANDLER_ERRORS = Counter(
+    "bot_handler_errors_total", "Исключения в обработчиках", ["handler"],
+)
+UPDATES_IN_FLIGHT = Gauge(
+    "bot_updates_in_flight", "Апдейты, которые сейчас обрабатываются",
+)
+DROPPED_UPDATES = Counter(
+    "bot_updates_dropped_total", "Апдейты, отброшенные ограничителем", ["reason"],
+)
+QUERIES_PER_UPDATE = Histogram(
+    "bot_db_queries_per_update", "Запросов к базе на один апдейт", ["handler"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89),
+)
+DB_QUERIES = Counter(
+    "bot_db_queries_total", "Запросы к базе",
+)
+API_LATENCY = Histogram(
+    "bot_api_request_duration_seconds", "Время запроса к Bot API", ["method"],
+)
+API_ERRORS = Counter(
+    "bot_api_errors_total", "Ошибки запросов к Bot API", ["method"],
+)
+DB_POOL_WAIT = Histogram(
+    "bot_db_pool_wait_seconds", "Ожидание свободного соединения в пуле",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10),
+)
+DB_POOL_IN_USE = Gauge("bot_db_pool_in_use", "Занятые соединения пула")
+DB_POOL_SIZE = Gauge("bot_db_pool_size", "Открытые соединения пула")
+DB_POOL_MAX_SIZE = Gauge("bot_db_pool_max_size", "Максимальный размер пула")
+DB_POOL_TIMEOUTS = Gauge("bot_db_pool_acquire_timeouts", "Сколько раз соединение не дождались")
+
+# Супервизор (supervisor.py): состояние воркеров по их последнему отчёту
+WORKER_UP = Gauge("bot_worker_up", "Воркер жив и вовремя присылает отчёты", ["worker"])
+WORKER_QUEUE_DEPTH = Gauge("bot_worker_queue_depth", "Апдейты, ждущие в очереди воркера", ["worker"])
+WORKER_IN_FLIGHT = Gauge("bot_worker_in_flight", "Апдейты, которые воркер сейчас обрабатывает", ["worker"])
+WORKER_PROCESSED = Gauge("bot_worker_processed", "Апдейты, обработанные воркером с его запуска", ["worker"])
+WORKER_RESTARTS = Counter("bot_worker_restarts_total", "Перезапуски упавших и зависших воркеров", ["worker"])
+
+# Счётчик запросов и имя обработчика текущего апдейта
+current_update = ContextVar("current_update", default=None)
+# Защита от двойного счёта, когда один execute_* вызывает другой
+inside_query = ContextVar("inside_query", default=False)
+
+
+# Внешний middleware на dp.update: апдейты в работе и число запросов к базе на апдейт
+class UpdateMetricsMiddleware(BaseMiddleware):
+    async def __call__(self, handler, event, data):
+        info = {'handler': 'unhandled', 'queries': 0}
+        token = current_update.set(info)
+        UPDATES_IN_FLIGHT.inc()
+        try:
+            return await handler(event, data)
+        finally:
+            UPDATES_IN_FLIGHT.dec()
+            QUERIES_PER_UPDATE.labels(info['handler']).observe(info['queries'])
+            current_update.reset(token)
+
+
+# Внутренний middleware на message/callback_query: задержка и ошибки конкретного обработчика
+class HandlerMetricsMiddleware(BaseMiddleware):
+    async def __call__(self, handler, event, data):
+        name = data['handler'].callback.__name__
+        info = current_update.get()
+        if info is not None:
+            info['handler'] = name
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.labels(info['handler'] if info is not None else name).inc()
+            raise
+        finally:
+            # Маршрутизатор нажатий (callbacks.py) подменяет имя на настоящий обработчик
+            HANDLER_LATENCY.labels(info['handler'] if info is not None else name).observe(time.perf_counter() - started)
+
+
+# Имя обработчика, до которого апдейт дошёл через общий диспетчер, а не напрямую из aiogram
+def set_handler_name(name):
+    info = current_update.get()
+    if info is not None:
+        info['handler'] = name
+
+
+# Middleware сессии бота: время и ошибки каждого метода Bot API
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    async def __call__(self, make_request, bot, method):
+        name = method.__api_method__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception:
+            API_ERRORS.labels(name).inc()
+            raise
+        finally:
+            API_LATENCY.labels(name).observe(time.perf_counter() - started)
+
+
+def _count_queries(method):
+    async def wrapper(*args, **kwargs):
+        if inside_query.get():
+            return await method(*args, **kwargs)
+        DB_QUERIES.inc()
+        info = current_update.get()
+        if info is not None:
+            info['queries'] += 1
+        token = inside_query.set(True)
+        try:
+            return await method(*args, **kwargs)
+        finally:
+            inside_query.reset(token)
+    wrapper.counted = True
+    return wrapper
+
+
+# Tortoise не даёт хуков на запросы, поэтому оборачиваем execute_* у класса клиента
+# и всех его наследников (обёртки транзакций наследуются от клиента)
+def install_query_hook():
+    classes = [type(Tortoise.get_connection("default"))]
+    while classes:
+        cls = classes.pop()
+        for name in ('execute_query', 'execute_query_dict', 'execute_insert', 'execute_many', 'execute_script'):
+            method = cls.__dict__.get(name)
+            if method is not None and not getattr(method, 'counted', False):
+                setattr(cls, name, _count_queries(method))
+        classes.extend(cls.__subclasses__())
+
+
+def install_pool_metrics():
+    if DB_POOL_WAIT.observe not in wait_observers:
+        wait_observers.append(DB_POOL_WAIT.observe)
+    DB_POOL_IN_USE.set_function(lambda: pool_stats().get('in_use', 0))
+    DB_POOL_SIZE.set_function(lambda: pool_stats().get('size', 0))
+    DB_POOL_MAX_SIZE.set_function(lambda: pool_stats().get('max_size', 0))
+    DB_POOL_TIMEOUTS.set_function(lambda: pool_stats()['timeouts'])
+
+
+def setup_metrics(dp, bot):
+    dp.update.outer_middleware(UpdateMetricsMiddleware())
+    dp.message.middleware(HandlerMetricsMiddleware())
+    dp.callback_query.middleware(HandlerMetricsMiddleware())
+    bot.session.middleware(ApiMetricsMiddleware())
+
+
+async def metrics_handler(request):
+    return web.Response(body=generate_latest(), headers={"Content-Type": CONTENT_TYPE_LATEST})
+
+
+# Отдельный HTTP-сервер с /metrics; работает и при polling, и при webhook.
+# database=False — для процесса без подключения к базе (супервизор воркеров)
+class MetricsServer:
+    def __init__(self, host=METRICS_HOST, port=METRICS_PORT, database=True):
+        self.host = host
+        self.port = port
+        self.database = database
+        self.runner = None
+
+    async def start(self):
+        if self.database:
+            install_query_hook()
+            install_pool_metrics()
+        if not self.port:
+            return
+        app = web.Application()
+        app.router.add_get("/metrics", metrics_handler)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.host, self.port).start()
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
@@ -0,0 +1,155 @@
+import asyncio
+from datetime import timedelta
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+from tortoise import timezone
+from tortoise.transactions import in_transaction
+
+from config import OUTBOX_WORKERS, OUTBOX_MAX_ATTEMPTS
+from database.models import Notification
+
+
+# Кладёт уведомление в очередь. Вызывать внутри транзакции, которая меняет задачу,
+# чтобы уведомление не потерялось и не ушло без изменения.
+async def enqueue_notification(user_id, text, using_db=None):
+    return await Notification.create(
+        user_id=str(user_id), text=text, next_attempt_at=timezone.now(), using_db=using_db
+    )
+
+
+# Пакетная версия enqueue_notification: messages — список (user_id, text), одна вставка
+async def enqueue_notifications(messages, using_db=None):
+    now = timezone.now()
+    await Notification.bulk_create(
+        [Notification(user_id=str(user_id), text=text, next_attempt_at=now) for user_id, text in messages],
+        batch_size=500,
+        using_db=using_db,
+    )
+
+
+# Пул фоновых воркеров, которые отправляют уведомления из таблицы notifications.
+# Каждый воркер забирает пачку строк и продлевает им срок (аренду), поэтому несколько
+# воркеров и реплик не отправят одно уведомление дважды. Аренда продлевается перед каждой
+# отправкой и пока отправка ждёт лимита или повторяет 429: пачка может отправляться дольше аренды.
+class Outbox:
+    def __init__(self, delivery, workers=OUTBOX_WORKERS, max_attempts=OUTBOX_MAX_ATTEMPTS,
+                 batch_size=20, poll_interval=2.0, lease=60):
+        self.delivery = delivery
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.lease = timedelta(seconds=lease)
+        self.wakeup = asyncio.Event()
+        self.tasks = []
+
+    async def start(self):
+        self.tasks = [asyncio.create_task(self.worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    # Будит воркеры сразу после коммита, не дожидаясь очередного опроса
+    def wake(self):
+        self.wakeup.set()
+
+    async def claim(self):
+        now = timezone.now()
+        lease_until = now + self.lease
+        async with in_transaction() as conn:
+            batch = await (
+                Notification.filter(status='pending', next_attempt_at__lte=now)
+                .order_by('id')
+                .limit(self.batch_size)
+                .select_for_update(skip_locked=True)
+                .using_db(conn)
+            )
+            if batch:
+                await Notification.filter(id__in=[n.id for n in batch]).using_db(conn).update(
+                    next_attempt_at=lease_until
+                )
+        # Срок аренды служит меткой владельца: по нему продление проверяет, что строку не забрали
+        for notification in batch:
+            notification.next_attempt_at = lease_until
+        return batch
+
+    # Продлевает аренду, только если строка всё ещё наша. False — аренда истекла
+    # и уведомление забрал другой воркер.
+    async def renew(self, notification):
+        lease_until = timezone.now() + self.lease
+        renewed = await Notification.filter(
+            id=notification.id, status='pending', next_attempt_at=notification.next_attempt_at
+        ).update(next_attempt_at=lease_until)
+        if renewed:
+            notification.next_attempt_at = lease_until
+        return bool(renewed)
+
+    # Продлевает аренду, пока идёт отправка (ожидание лимита, повторы после 429)
+    async def keep_lease(self, notification):
+        while True:
+            await asyncio.sleep(self.lease.total_seconds() / 3)
+            try:
+                if not await self.renew(notification):
+                    return
+            except Exception as e:
+                print(f"Не удалось продлить аренду уведомления {notification.id}: {e}")
+
+    async def send(self, notification):
+        keeper = asyncio.create_task(self.keep_lease(notification))
+        try:
+            await self.delivery.send_message(int(notification.user_id), notification.text)
+        finally:
+            keeper.cancel()
+
+    async def deliver(self, notification):
+        # Пока ждали своей очереди в пачке, аренда могла истечь — тогда отправляет другой воркер
+        if not await self.renew(notification):
+            return
+        try:
+            await self.send(notification)
+        except (TelegramForbiddenError, TelegramBadRequest) as e:
+            # Бот заблокирован или чат не существует — повтор не поможет
+            await self._fail(notification, e, retry=False)
+        except Exception as e:
+            await self._fail(notification, e, retry=True)
+        else:
+            await Notification.filter(id=notification.id).update(status='sent', sent_at=timezone.now())
+
+    async def _fail(self, notification, error, retry):
+        attempts = notification.attempts + 1
+        print(f"Не удалось отправить уведомление пользователю {notification.user_id} (попытка {attempts}): {error}")
+        if retry and attempts < self.max_attempts:
+            # Экспоненциальная пауза: 10 с, 20 с, 40 с ... но не больше часа
+            delay = timedelta(seconds=min(10 * 2 ** (attempts - 1), 3600))
+            await Notification.filter(id=notification.id).update(
+                attempts=attempts, last_error=str(error), next_attempt_at=timezone.now() + delay
+            )
+        else:
+            await Notification.filter(id=notification.id).update(
+                attempts=attempts, last_error=str(error), status='failed'
+            )
+
+    async def worker(self):
+        while True:
+            try:
+                batch = await self.claim()
+            except Exception as e:
+                print(f"Ошибка чтения очереди уведомлений: {e}")
+                batch = []
+            if not batch:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self.wakeup.clear()
+                continue
+            for notification in batch:
+                # Сбой базы на одном уведомлении не должен останавливать воркер: строка
+                # останется в аренде и после её истечения будет забрана снова
+                try:
+                    await self.deliver(notification)
+                except Exception as e:
+                    print(f"Ошибка отправки уведомления {notification.id}: {e}")
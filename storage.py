@@ -0,0 +1,70 @@
+import time
+from datetime import timedelta
+
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder
+from aiogram.fsm.storage.memory import MemoryStorage
+from tortoise import timezone
+
+from config import FSM_STORAGE, REDIS_URL, FSM_TTL
+from database.models import FsmRecord
+
+# Как часто чистить истёкшие записи из таблицы, секунд
+PURGE_INTERVAL = 600
+
+
+# Хранилище FSM в основной базе: одна строка на ключ, запись — один upsert
+class DatabaseStorage(BaseStorage):
+    def __init__(self, ttl=FSM_TTL):
+        self.ttl = timedelta(seconds=ttl)
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self.last_purge = time.monotonic()
+
+    async def _upsert(self, key, update_fields, **values):
+        record = FsmRecord(key=self.key_builder.build(key), expires_at=timezone.now() + self.ttl, **values)
+        await FsmRecord.bulk_create([record], on_conflict=['key'], update_fields=update_fields + ['expires_at'])
+        if time.monotonic() - self.last_purge > PURGE_INTERVAL:
+            self.last_purge = time.monotonic()
+            await FsmRecord.filter(expires_at__lte=timezone.now()).delete()
+
+    async def _get(self, key, field):
+        values = await FsmRecord.filter(
+            key=self.key_builder.build(key), expires_at__gt=timezone.now()
+        ).values_list(field, flat=True)
+        return values[0] if values else None
+
+    async def set_state(self, key, state=None):
+        state = state.state if isinstance(state, State) else state
+        await self._upsert(key, ['state'], state=state, data={})
+
+    async def get_state(self, key):
+        return await self._get(key, 'state')
+
+    async def set_data(self, key, data):
+        if not isinstance(data, dict):
+            raise DataNotDictLikeError(f"Data must be a dict or dict-like object, got {type(data).__name__}")
+        await self._upsert(key, ['data'], state=None, data=data)
+
+    async def get_data(self, key):
+        return await self._get(key, 'data') or {}
+
+    async def close(self):
+        pass
+
+
+def create_storage():
+    if FSM_STORAGE == "postgres":
+        return DatabaseStorage()
+    if FSM_STORAGE == "redis":
+        # redis нужен только для этого режима
+        from aiogram.fsm.storage.redis import RedisStorage
+        return RedisStorage.from_url(REDIS_URL, state_ttl=FSM_TTL, data_ttl=FSM_TTL)
+    return MemoryStorage()
+
+
+# Для нескольких реплик события одного пользователя обрабатываются под распределённой блокировкой
+def create_events_isolation(storage):
+    if hasattr(storage, "create_isolation"):
+        return storage.create_isolation()
+    return None
@@ -0,0 +1,363 @@
+import asyncio
+import multiprocessing
+import os
+import queue
+import signal
+import time
+
+from config import (
+    BOT_MODE, CACHE_BACKEND, FSM_STORAGE, POSTGRES_URI, WORKERS, WORKER_QUEUE_SIZE, WORKER_CONCURRENCY,
+    WORKER_HEARTBEAT, WORKER_STALL_TIMEOUT, WORKER_DRAIN_TIMEOUT,
+)
+from metrics import (
+    MetricsServer, WORKER_UP, WORKER_QUEUE_DEPTH, WORKER_IN_FLIGHT, WORKER_PROCESSED, WORKER_RESTARTS,
+)
+
+# Long polling в режиме супервизора: сколько секунд Telegram держит запрос и пауза после ошибки
+POLLING_TIMEOUT = 30
+POLLING_RETRY = 5
+
+
+# Пользователь, от которого пришёл апдейт: по нему апдейт закрепляется за воркером.
+# Для апдейтов без пользователя берётся чат, для служебных — 0
+def update_user_id(update):
+    for key, event in update.items():
+        if key == 'update_id' or not isinstance(event, dict):
+            continue
+        owner = event.get('from') or event.get('user') or event.get('chat') or {}
+        return owner.get('id', 0)
+    return 0
+
+
+def shard_of(update, workers):
+    return abs(update_user_id(update)) % workers
+
+
+# Цикл воркера: берёт апдейты своей очереди и кормит ими dp.
+# Апдейты одного пользователя выполняются строго по очереди, разных — параллельно, не больше concurrency.
+# Принятых и ещё не обработанных апдейтов не больше backlog — память воркера ограничена
+class WorkerLoop:
+    def __init__(self, dp, bot, concurrency=WORKER_CONCURRENCY, backlog=WORKER_QUEUE_SIZE):
+        self.dp = dp
+        self.bot = bot
+        self.slots = asyncio.Semaphore(concurrency)
+        self.backlog = asyncio.Semaphore(backlog)
+        # user_id -> последняя задача пользователя, следующая ждёт её завершения
+        self.tails = {}
+        self.in_flight = 0
+        self.processed = 0
+        self.errors = 0
+
+    async def _process(self, user_id, update, previous):
+        try:
+            if previous is not None:
+                await asyncio.wait([previous])
+            # Слот занимается, только когда подошла очередь пользователя: поток апдейтов одного
+            # пользователя ждёт своей очереди, не отнимая слоты у остальных
+            async with self.slots:
+                await self.dp.feed_raw_update(self.bot, update)
+        except Exception as e:
+            self.errors += 1
+            print(f"Ошибка обработки апдейта {update.get('update_id')}: {e}")
+        finally:
+            self.in_flight -= 1
+            self.processed += 1
+            self.backlog.release()
+            if self.tails.get(user_id) is asyncio.current_task():
+                del self.tails[user_id]
+
+    async def run(self, updates):
+        loop = asyncio.get_running_loop()
+        while True:
+            # Место занимается до чтения: лишние апдейты ждут в очереди процесса, а не в памяти воркера
+            await self.backlog.acquire()
+            update = await loop.run_in_executor(None, updates.get)
+            if update is None:
+                self.backlog.release()
+                break
+            user_id = update_user_id(update)
+            self.in_flight += 1
+            self.tails[user_id] = asyncio.create_task(self._process(user_id, update, self.tails.get(user_id)))
+        # Дорабатываем принятые апдейты
+        if self.tails:
+            await asyncio.wait(list(self.tails.values()))
+
+
+async def serve(index, updates, status, prepare=None):
+    import bot as bot_module
+    from database import setup, close
+
+    # У каждого воркера свой /metrics: порт супервизора + номер воркера
+    if bot_module.metrics_server.port:
+        bot_module.metrics_server.port += index + 1
+    if prepare is not None:
+        prepare(bot_module)
+    dp, bot = bot_module.dp, bot_module.bot
+    worker = WorkerLoop(dp, bot)
+
+    async def heartbeat():
+        while True:
+            status.put({
+                'worker': index, 'pid': os.getpid(), 'time': time.time(),
+                'in_flight': worker.in_flight, 'processed': worker.processed, 'errors': worker.errors,
+            })
+            await asyncio.sleep(WORKER_HEARTBEAT)
+
+    await setup()
+    await dp.emit_startup(bot=bot, dispatcher=dp)
+    reporter = asyncio.create_task(heartbeat())
+    try:
+        await worker.run(updates)
+    finally:
+        reporter.cancel()
+        await dp.emit_shutdown(bot=bot, dispatcher=dp)
+        await close()
+        await bot.session.close()
+        # Последний отчёт: сколько обработано до остановки
+        status.put({'worker': index, 'pid': os.getpid(), 'time': time.time(), 'in_flight': 0,
+                    'processed': worker.processed, 'errors': worker.errors, 'stopped': True})
+
+
+# Точка входа процесса-воркера. Ctrl+C приходит всей группе процессов — останавливает воркеры супервизор
+def run_worker(index, updates, status, prepare=None):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(serve(index, updates, status, prepare))
+
+
+# Супервизор: принимает апдейты (polling или webhook) и раздаёт их N процессам по id пользователя.
+# Все апдейты пользователя попадают в один воркер и идут там по порядку, поэтому ограничитель,
+# склейка альбомов и блокировки пользователя в памяти воркера остаются верными.
+# Общие данные — в базе: состояния FSM, уведомления (outbox забирает их с SKIP LOCKED).
+# Для webhook.run_webhook супервизор выглядит как Dispatcher: feed_raw_update, emit_startup, emit_shutdown.
+class Supervisor:
+    def __init__(self, workers=WORKERS, queue_size=WORKER_QUEUE_SIZE, prepare=None):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.prepare = prepare
+        self.context = multiprocessing.get_context('spawn')
+        # У каждого воркера своя очередь апдейтов и своя очередь отчётов
+        self.queues = [None] * workers
+        self.reports = [None] * workers
+        self.processes = [None] * workers
+        # Последний отчёт каждого воркера
+        self.health = [{} for _ in range(workers)]
+        self.started_at = [0.0] * workers
+        # Апдейты, ещё не переданные в очередь воркера, в порядке поступления, и по одной
+        # задаче на воркер, которая перекладывает их оттуда (см. feed_raw_update)
+        self.buffers = [asyncio.Queue() for _ in range(workers)]
+        self.feeders = []
+        self.monitor_task = None
+        self.metrics_server = MetricsServer(database=False)
+
+    def start_worker(self, index):
+        # Процесс, убитый посреди get() или put(), оставляет блокировку очереди занятой навсегда,
+        # поэтому новый воркер получает новые очереди
+        self.drop_queues(index)
+        self.queues[index] = self.context.Queue(self.queue_size)
+        self.reports[index] = self.context.Queue()
+        process = self.context.Process(
+            target=run_worker, args=(index, self.queues[index], self.reports[index], self.prepare),
+            name=f"teamreel-worker-{index}", daemon=True,
+        )
+        process.start()
+        self.processes[index] = process
+        self.health[index] = {}
+        self.started_at[index] = time.time()
+
+    # Брошенные очереди не ждут при выходе, пока их содержимое кто-нибудь прочитает
+    def drop_queues(self, index):
+        for abandoned in (self.queues[index], self.reports[index]):
+            if abandoned is not None:
+                abandoned.cancel_join_thread()
+                abandoned.close()
+
+    def restart_worker(self, index, reason):
+        process = self.processes[index]
+        lost = self.queue_depth(index)
+        print(f"Воркер {index} (pid {process.pid}) {reason}, перезапускаю; потеряно апдейтов из очереди: {lost}")
+        if process.is_alive():
+            process.kill()
+        process.join()
+        WORKER_RESTARTS.labels(index).inc()
+        self.start_worker(index)
+
+    # Апдейт встаёт в буфер воркера сразу, без ожидания: порядок вызовов и есть порядок обработки,
+    # сколько бы обработчиков WebhookServer ни вызывали этот метод одновременно.
+    # Когда воркер не успевает, вызывающий ждёт уже после постановки — так сохраняется
+    # обратное давление на WebhookServer и polling, а порядок апдейтов пользователя не нарушается
+    async def feed_raw_update(self, bot, update):
+        buffer = self.buffers[shard_of(update, self.workers)]
+        buffer.put_nowait(update)
+        while buffer.qsize() >= self.queue_size:
+            await asyncio.sleep(0.05)
+
+    # Единственный писатель в очередь воркера: перекладывает буфер по порядку.
+    # None — признак конца, он передаётся воркеру последним
+    async def feed_worker(self, index):
+        buffer = self.buffers[index]
+        while True:
+            update = await buffer.get()
+            # Очередь берётся заново на каждой попытке: воркер могли перезапустить с новой
+            while True:
+                try:
+                    self.queues[index].put_nowait(update)
+                    break
+                except queue.Full:
+                    await asyncio.sleep(0.05)
+            if update is None:
+                return
+
+    def queue_depth(self, index):
+        try:
+            return self.queues[index].qsize()
+        except NotImplementedError:
+            # macOS не умеет считать длину очереди процесса
+            return None
+
+    def collect_reports(self):
+        for index, reports in enumerate(self.reports):
+            while reports is not None:
+                try:
+                    self.health[index] = reports.get_nowait()
+                except queue.Empty:
+                    break
+
+    def check_workers(self):
+        self.collect_reports()
+        now = time.time()
+        for index, process in enumerate(self.processes):
+            last = self.health[index].get('time', self.started_at[index])
+            if not process.is_alive():
+                self.restart_worker(index, f"завершился с кодом {process.exitcode}")
+            elif now - last > WORKER_STALL_TIMEOUT:
+                self.restart_worker(index, f"не отвечает {now - last:.0f} с")
+            report = self.health[index]
+            WORKER_UP.labels(index).set(1 if report and now - report['time'] <= WORKER_HEARTBEAT * 3 else 0)
+            WORKER_IN_FLIGHT.labels(index).set(report.get('in_flight', 0))
+            WORKER_PROCESSED.labels(index).set(report.get('processed', 0))
+            depth = self.queue_depth(index)
+            if depth is not None:
+                WORKER_QUEUE_DEPTH.labels(index).set(depth)
+
+    async def monitor(self):
+        while True:
+            await asyncio.sleep(WORKER_HEARTBEAT)
+            try:
+                self.check_workers()
+            except Exception as e:
+                print(f"Ошибка проверки воркеров: {e}")
+
+    def processed(self):
+        self.collect_reports()
+        return sum(report.get('processed', 0) for report in self.health)
+
+    async def emit_startup(self, **kwargs):
+        for index in range(self.workers):
+            self.start_worker(index)
+        self.feeders = [asyncio.create_task(self.feed_worker(index)) for index in range(self.workers)]
+        await self.metrics_server.start()
+        self.monitor_task = asyncio.create_task(self.monitor())
+        print(f"Запущено воркеров: {self.workers}")
+
+    # Каждому воркеру — признак конца очереди после всех принятых апдейтов;
+    # кто не успел доработать за timeout, останавливается принудительно
+    async def emit_shutdown(self, timeout=WORKER_DRAIN_TIMEOUT, **kwargs):
+        if self.monitor_task:
+            self.monitor_task.cancel()
+            self.monitor_task = None
+        deadline = time.monotonic() + timeout
+        for buffer in self.buffers:
+            buffer.put_nowait(None)
+        if self.feeders:
+            await asyncio.wait(self.feeders, timeout=timeout)
+        for feeder in self.feeders:
+            feeder.cancel()
+        self.feeders = []
+        for index, process in enumerate(self.processes):
+            await asyncio.to_thread(process.join, max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                print(f"Воркер {index} не доработал очередь за {timeout:.0f} с, останавливаю")
+                process.kill()
+                process.join()
+        self.collect_reports()
+        for index in range(self.workers):
+            self.drop_queues(index)
+        await self.metrics_server.stop()
+
+    def resolve_used_update_types(self):
+        from bot import dp
+        return dp.resolve_used_update_types()
+
+
+# Long polling в супервизоре: апдейты подтверждаются, как только приняты супервизором —
+# при остановке он передаёт воркерам всё принятое
+# Останавливается отменой задачи
+async def poll(supervisor, bot):
+    allowed_updates = supervisor.resolve_used_update_types()
+    offset = None
+    try:
+        while True:
+            try:
+                updates = await bot.get_updates(
+                    offset=offset, timeout=POLLING_TIMEOUT, allowed_updates=allowed_updates,
+                    request_timeout=POLLING_TIMEOUT + 10,
+                )
+            except Exception as e:
+                print(f"Не удалось получить апдейты: {e}")
+                await asyncio.sleep(POLLING_RETRY)
+                continue
+            for update in updates:
+                await supervisor.feed_raw_update(bot, update.model_dump(mode='json', exclude_none=True, by_alias=True))
+                offset = update.update_id + 1
+    finally:
+        if offset is not None:
+            # Подтверждаем уже розданные апдейты, чтобы после перезапуска они не пришли повторно
+            try:
+                await bot.get_updates(offset=offset, timeout=0, limit=1)
+            except Exception as e:
+                print(f"Не удалось подтвердить апдейты: {e}")
+
+
+# Общее состояние должно жить вне процесса воркера: перезапуск воркера не теряет диалоги,
+# а кэш в памяти одного воркера не видел бы сбросов из других
+def shared_state_env():
+    env = {}
+    if FSM_STORAGE == "memory":
+        env['FSM_STORAGE'] = "postgres"
+    if CACHE_BACKEND == "memory":
+        env['CACHE_BACKEND'] = "none"
+    for key, value in env.items():
+        print(f"Режим воркеров: {key}={value} вместо memory")
+        os.environ[key] = value
+    if POSTGRES_URI.startswith("sqlite"):
+        print("Режим воркеров на SQLite: запись из нескольких процессов упирается в блокировку файла, нужен Postgres")
+
+
+async def run_supervisor(started_at=None):
+    from bot import bot
+    from database import setup, close
+
+    shared_state_env()
+    # Миграции выполняет супервизор один раз, до запуска воркеров
+    await setup()
+    await close()
+
+    supervisor = Supervisor()
+    if BOT_MODE == "webhook":
+        from webhook import run_webhook
+        await run_webhook(supervisor, bot)
+        return
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await supervisor.emit_startup()
+    if started_at is not None:
+        print(f"Супервизор готов принимать апдейты через {time.perf_counter() - started_at:.2f} с после запуска")
+    polling = asyncio.create_task(poll(supervisor, bot))
+    await stop.wait()
+    polling.cancel()
+    await asyncio.gather(polling, return_exceptions=True)
+    await supervisor.emit_shutdown()
+    await bot.session.close()
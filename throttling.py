@@ -0,0 +1,146 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+from aiogram import BaseMiddleware
+from aiogram.types import Update
+
+from callbacks import SEPARATOR
+from config import USER_RATE, USER_BURST, DEDUP_WINDOW, THROTTLE_MAXSIZE
+from metrics import DROPPED_UPDATES
+
+# Сообщения с файлами — это сдаваемая работа: лимит их не отбрасывает
+FILE_CONTENT_TYPES = frozenset({'document', 'photo', 'video', 'audio', 'voice', 'video_note', 'animation'})
+THROTTLED_NOTICE = "Слишком много сообщений подряд — последнее пропущено. Повторите через пару секунд."
+
+
+# Словарь с вытеснением самых давних ключей, чтобы поток апдейтов от множества
+# аккаунтов не раздувал память
+class BoundedDict(OrderedDict):
+    def __init__(self, maxsize):
+        super().__init__()
+        self.maxsize = maxsize
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        while len(self) > self.maxsize:
+            self.popitem(last=False)
+
+
+# Внешний middleware на dp.update, до FSM: отбрасывает лишние апдейты раньше,
+# чем они возьмут блокировку состояния, пойдут в базу или в Bot API.
+# - у каждого пользователя своё ведро токенов (rate в секунду, не больше burst подряд);
+# - повторное нажатие той же кнопки, пока первое ещё обрабатывается, получает его результат;
+# - повторное нажатие в течение window секунд после обработки отбрасывается.
+# - сообщения одного альбома расходуют один токен на весь альбом.
+# Кнопки-переключатели (префиксы repeatable) не склеиваются: второе нажатие — отдельное действие.
+# Склеенное или отброшенное нажатие подтверждается пустым answer(), чтобы у пользователя не висели
+# часики, — но только пока пользователь укладывается в лимит: флуд не превращается в запросы к API.
+# Сообщения с файлами проходят сверх лимита, об отброшенном сообщении пользователь узнаёт
+# (не чаще раза за время восполнения ведра).
+class ThrottlingMiddleware(BaseMiddleware):
+    def __init__(self, rate=USER_RATE, burst=USER_BURST, window=DEDUP_WINDOW, maxsize=THROTTLE_MAXSIZE, repeatable=()):
+        self.rate = rate
+        self.burst = burst
+        self.window = window
+        self.maxsize = maxsize
+        self.repeatable = frozenset(repeatable)
+        # user_id -> (токены, время последнего пополнения)
+        self.buckets = BoundedDict(maxsize)
+        # (user_id, callback_data) -> до какого момента повтор считается дублем
+        self.recent = BoundedDict(maxsize)
+        # (user_id, callback_data) -> future с результатом обработчика
+        self.in_flight = {}
+
+    def allow(self, user_id):
+        now = time.monotonic()
+        tokens, updated = self.buckets.get(user_id, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        if tokens < 1:
+            self.buckets[user_id] = (tokens, now)
+            return False
+        self.buckets[user_id] = (tokens - 1, now)
+        return True
+
+    async def answer_dropped(self, bot, user_id, callback_query):
+        if not self.allow(user_id):
+            return
+        try:
+            await bot.answer_callback_query(callback_query.id)
+        except Exception as e:
+            # Нажатие могло устареть, пока ждало своей очереди
+            print(f"Не удалось подтвердить повторное нажатие: {e}")
+
+    async def notify_throttled(self, bot, user_id, message):
+        notice = (user_id, 'throttled')
+        now = time.monotonic()
+        expires = self.recent.get(notice)
+        if expires is not None and expires > now:
+            return
+        self.recent[notice] = now + self.burst / self.rate
+        try:
+            await bot.send_message(message.chat.id, THROTTLED_NOTICE)
+        except Exception as e:
+            print(f"Не удалось предупредить об отброшенном сообщении: {e}")
+
+    async def __call__(self, handler, event: Update, data):
+        user = data.get('event_from_user')
+        if user is None:
+            return await handler(event, data)
+
+        key = None
+        callback_query = event.callback_query
+        if callback_query is not None and (callback_query.data or "").split(SEPARATOR, 1)[0] not in self.repeatable:
+            key = (user.id, callback_query.data)
+            running = self.in_flight.get(key)
+            if running is not None:
+                DROPPED_UPDATES.labels('coalesced').inc()
+                await self.answer_dropped(data['bot'], user.id, callback_query)
+                return await asyncio.shield(running)
+            expires = self.recent.get(key)
+            if expires is not None and expires > time.monotonic():
+                DROPPED_UPDATES.labels('duplicate').inc()
+                await self.answer_dropped(data['bot'], user.id, callback_query)
+                return None
+
+        # Альбом приходит пачкой сообщений, но для лимита это одно действие пользователя
+        if event.message is not None and event.message.media_group_id:
+            album = (user.id, 'album', event.message.media_group_id)
+            seen = album in self.recent
+            self.recent[album] = time.monotonic() + self.window
+            if seen:
+                return await handler(event, data)
+
+        if not self.allow(user.id):
+            message = event.message
+            if message is not None and message.content_type in FILE_CONTENT_TYPES:
+                return await handler(event, data)
+            DROPPED_UPDATES.labels('throttled').inc()
+            if message is not None:
+                await self.notify_throttled(data['bot'], user.id, message)
+            return None
+
+        # Если одновременно в работе слишком много нажатий, новые просто не склеиваются
+        if key is None or len(self.in_flight) >= self.maxsize:
+            return await handler(event, data)
+
+        future = asyncio.get_running_loop().create_future()
+        self.in_flight[key] = future
+        result = None
+        try:
+            result = await handler(event, data)
+            return result
+        finally:
+            del self.in_flight[key]
+            self.recent[key] = time.monotonic() + self.window
+            # Ошибку уже обработал первый апдейт, дубли получают None
+            future.set_result(result)
+
+
+# Ограничитель должен стоять до FSMContextMiddleware, который Dispatcher регистрирует
+# сам: переставляем FSM в конец цепочки внешних middleware
+def setup_throttling(dp, repeatable=()):
+    dp.update.outer_middleware.unregister(dp.fsm)
+    dp.update.outer_middleware(ThrottlingMiddleware(repeatable=repeatable))
+    dp.update.outer_middleware(dp.fsm)
@@ -0,0 +1,116 @@
+import hashlib
+import hmac
+import json
+import time
+from datetime import datetime, timezone
+
+from aiogram import BaseMiddleware
+
+from config import ADMIN_ID, TRACE_FILE, TRACE_SALT
+
+# Поля с персональными данными, которые в трассу не попадают. Имя файла часто содержит
+# фамилию или название документа, боту оно не нужно.
+DROPPED_FIELDS = {
+    'last_name', 'username', 'language_code', 'title', 'bio', 'vcard', 'file_name',
+    'author_signature', 'forward_signature', 'forward_sender_name',
+}
+# Обязательные поля Telegram заменяются заглушкой, чтобы апдейт оставался валидным
+MASKED_FIELDS = {'first_name': 'user', 'sender_user_name': 'user', 'phone_number': '0'}
+# Объекты, чей id — это пользователь или чат (в том числе автор пересланного сообщения)
+ID_OWNERS = {
+    'from', 'from_user', 'chat', 'user', 'sender_chat', 'sender_user', 'forward_from', 'forward_from_chat',
+    'new_chat_members', 'left_chat_member', 'via_bot',
+}
+# Поля, в которых id пользователя или чата лежит напрямую (contact.user_id и т.п.)
+ID_FIELDS = {'user_id', 'chat_id'}
+FILE_FIELDS = {'file_id', 'file_unique_id'}
+TEXT_FIELDS = {'text', 'caption'}
+
+
+# Стабильный псевдоним id: одинаковый для пользователя и его личного чата, знак сохраняется
+def pseudonym(value, salt=TRACE_SALT):
+    digest = hmac.new(salt.encode(), str(abs(value)).encode(), hashlib.sha256).digest()
+    alias = int.from_bytes(digest[:4], 'big') % 10**9 + 1
+    return -alias if value < 0 else alias
+
+
+def _file_alias(value, salt=TRACE_SALT):
+    return "f" + hmac.new(salt.encode(), value.encode(), hashlib.sha256).hexdigest()[:24]
+
+
+# Обезличивает апдейт: id заменяются псевдонимами, имена и имена файлов удаляются, произвольный текст
+# заменяется строкой той же длины. Команды и тексты кнопок (keep_texts) остаются — по ним идёт маршрутизация.
+def anonymize(value, keep_texts=frozenset(), owner=None):
+    if isinstance(value, dict):
+        result = {}
+        for key, item in value.items():
+            if key in DROPPED_FIELDS:
+                continue
+            if key in MASKED_FIELDS:
+                result[key] = MASKED_FIELDS[key]
+                continue
+            if (key == 'id' and owner in ID_OWNERS or key in ID_FIELDS) and isinstance(item, int):
+                result[key] = pseudonym(item)
+            elif key in FILE_FIELDS and isinstance(item, str):
+                result[key] = _file_alias(item)
+            elif key in TEXT_FIELDS and isinstance(item, str):
+                result[key] = item if item.startswith('/') or item in keep_texts else 'x' * len(item)
+            elif key == 'entities' or key == 'caption_entities':
+                # Смещения сущностей остаются верными: длина текста не меняется
+                result[key] = [{k: v for k, v in e.items() if k in ('type', 'offset', 'length')} for e in item]
+            else:
+                result[key] = anonymize(item, keep_texts, key)
+        return result
+    if isinstance(value, list):
+        return [anonymize(item, keep_texts, owner) for item in value]
+    return value
+
+
+# Внешний middleware на dp.update: дописывает каждый входящий апдейт в трассу (JSON Lines).
+# Первая строка — заголовок с псевдонимами администраторов, дальше {"t": секунды от старта, "update": ...}.
+# Трасса проигрывается bench/replay.py.
+class TraceRecorder(BaseMiddleware):
+    def __init__(self, path, keep_texts=frozenset()):
+        self.path = path
+        self.keep_texts = frozenset(keep_texts)
+        self.file = None
+        self.started = None
+
+    def open(self):
+        self.file = open(self.path, 'a', encoding='utf-8')
+        self.started = time.monotonic()
+        self._write({
+            'trace': 1,
+            'started_at': datetime.now(timezone.utc).isoformat(),
+            'admins': [pseudonym(int(admin_id)) for admin_id in ADMIN_ID if admin_id.isdigit()],
+        })
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+    def _write(self, record):
+        self.file.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n')
+
+    async def __call__(self, handler, event, data):
+        if self.file is None:
+            self.open()
+        try:
+            update = anonymize(event.model_dump(mode='json', exclude_none=True, by_alias=True), self.keep_texts)
+            self._write({'t': round(time.monotonic() - self.started, 3), 'update': update})
+        except Exception as e:
+            # Запись трассы не должна мешать обработке апдейта
+            print(f"Не удалось записать апдейт в трассу: {e}")
+        return await handler(event, data)
+
+
+# Запись включается переменной TRACE_FILE. Регистрировать первой из своих middleware,
+# чтобы в трассу попадали и апдейты, которые потом отбросит ограничитель.
+def setup_tracing(dp, keep_texts=frozenset()):
+    if not TRACE_FILE:
+        return None
+    recorder = TraceRecorder(TRACE_FILE, keep_texts)
+    dp.update.outer_middleware(recorder)
+    dp.shutdown.register(recorder.close)
+    return recorder
@@ -0,0 +1,108 @@
+import asyncio
+import hmac
+import signal
+from urllib.parse import urlsplit
+
+from aiohttp import web
+
+from config import (
+    WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_HOST, WEBHOOK_PORT,
+    WEBHOOK_WORKERS, WEBHOOK_QUEUE_SIZE, WEBHOOK_DRAIN_TIMEOUT,
+)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+# Принимает апдейты от Telegram и обрабатывает их пулом из workers задач.
+# Очередь ограничена: когда она полна, запрос ждёт свободного места, и Telegram
+# сам притормаживает отправку — память не растёт под нагрузкой.
+# Без секрета любой, кто достучится до порта, может прислать апдейт от имени администратора,
+# поэтому сервер без WEBHOOK_SECRET не запускается.
+class WebhookServer:
+    def __init__(self, dp, bot, secret=WEBHOOK_SECRET, workers=WEBHOOK_WORKERS, queue_size=WEBHOOK_QUEUE_SIZE):
+        if not secret:
+            raise RuntimeError("WEBHOOK_SECRET не задан — укажите его в конфиге и перезапустите бота")
+        self.dp = dp
+        self.bot = bot
+        self.secret = secret
+        self.workers = workers
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.tasks = []
+
+    def create_app(self, path=WEBHOOK_PATH):
+        app = web.Application()
+        app.router.add_post(path, self.handle)
+        return app
+
+    async def handle(self, request):
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), self.secret):
+            return web.Response(status=401)
+        try:
+            update = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+        await self.queue.put(update)
+        return web.Response(text="ok")
+
+    async def worker(self):
+        while True:
+            update = await self.queue.get()
+            try:
+                await self.dp.feed_raw_update(self.bot, update)
+            except Exception as e:
+                print(f"Ошибка обработки апдейта {update.get('update_id')}: {e}")
+            finally:
+                self.queue.task_done()
+
+    def start_workers(self):
+        self.tasks = [asyncio.create_task(self.worker()) for _ in range(self.workers)]
+
+    # Дожидается обработки принятых апдейтов и останавливает воркеры
+    async def drain(self, timeout=WEBHOOK_DRAIN_TIMEOUT):
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            print(f"Не дождались обработки {self.queue.qsize()} апдейтов при остановке")
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+
+# Telegram принимает webhook только по https. Проверяем адрес до того, как займём порт
+# и запустим воркеры: иначе бот падает уже после старта, на set_webhook.
+def check_webhook_url(url):
+    parts = urlsplit(url)
+    if parts.scheme != "https" or not parts.hostname:
+        raise RuntimeError(
+            f"WEBHOOK_URL должен быть публичным https-адресом, например https://bot.example.com, а задан {url!r}"
+        )
+
+
+async def run_webhook(dp, bot):
+    check_webhook_url(WEBHOOK_URL)
+    server = WebhookServer(dp, bot)
+    runner = web.AppRunner(server.create_app())
+    await runner.setup()
+
+    await dp.emit_startup(bot=bot, dispatcher=dp)
+    server.start_workers()
+    await web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+    await bot.set_webhook(
+        WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+        secret_token=server.secret,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+    print(f"Webhook слушает {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+
+    # Сначала перестаём принимать запросы, затем дорабатываем то, что уже в очереди
+    await runner.cleanup()
+    await server.drain()
+    await dp.emit_shutdown(bot=bot, dispatcher=dp)
+    await bot.session.close()